@@ -1,29 +1,198 @@
 import sqlite3
 import os
+import threading
+import time
+from urllib.request import pathname2url
 
 # Define database path
 DB_FILENAME = 'users.db'
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DB_PATH= os.path.join(BASE_DIR, '../python-decorators-0x01', DB_FILENAME)
 
+# Settings applied to every pooled connection
+PRAGMAS = {
+    "journal_mode": "WAL",       # readers and the writer don't block each other
+    "synchronous": "NORMAL",     # safe with WAL, no fsync on every commit
+    "cache_size": -16000,        # 16 MiB page cache per connection
+    "mmap_size": 268435456,      # read pages through a 256 MiB memory map
+    "busy_timeout": 5000,        # wait up to 5s for a lock instead of failing
+}
+
 print("🔍 Using DB at:", DB_PATH)
+
+
+class ConnectionPool:
+    """
+    Keeps up to size open, pre-configured connections to one database.
+    Read-only pools open their connections with mode=ro, so they can never
+    take the write lock; in WAL mode they read alongside the writer.
+
+    A thread that already holds a connection from the pool gets the same
+    one back when it acquires again, so nested blocks share it (and its
+    transaction) instead of waiting on themselves; it goes back to the pool
+    when the outermost block releases it.
+    """
+    def __init__(self, db_path, size=4, readonly=False, timeout=5.0):
+        self.db_path = os.path.abspath(db_path)
+        self.size = size
+        self.readonly = readonly
+        self.timeout = timeout
+        self.idle = []          # a stack: last returned = warmest cache
+        self.opened = 0
+        self.held = {}          # thread id -> [connection, nesting depth]
+        self.lock = threading.Condition()
+
+    def acquire(self):
+        thread = threading.get_ident()
+        with self.lock:
+            held = self.held.get(thread)
+            if held:
+                held[1] += 1
+                return held[0]
+            deadline = time.monotonic() + self.timeout
+            while not self.idle and self.opened >= self.size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(f"No connection to {self.db_path} free after {self.timeout}s")
+                self.lock.wait(remaining)
+            if self.idle:
+                conn = self.idle.pop()
+                self.held[thread] = [conn, 1]
+                return conn
+            self.opened += 1
+        try:
+            conn = self._connect()
+        except Exception:
+            with self.lock:
+                self.opened -= 1
+                self.lock.notify()
+            raise
+        with self.lock:
+            self.held[thread] = [conn, 1]
+        return conn
+
+    def release(self, conn):
+        with self.lock:
+            for thread, held in self.held.items():
+                if held[0] is conn:
+                    held[1] -= 1
+                    if held[1]:
+                        return          # still in use by an outer block
+                    del self.held[thread]
+                    break
+        # Like closing a plain connection, uncommitted changes are discarded
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            conn.close()
+            with self.lock:
+                self.opened -= 1
+                self.lock.notify()      # a waiter may open a replacement
+            return
+        with self.lock:
+            self.idle.append(conn)
+            self.lock.notify()
+
+    def close(self):
+        with self.lock:
+            idle, self.idle = self.idle, []
+            self.opened -= len(idle)
+            self.lock.notify_all()
+        for conn in idle:
+            conn.close()
+
+    def _connect(self):
+        if self.readonly:
+            uri = "file:" + pathname2url(self.db_path) + "?mode=ro"
+            conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        else:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        for name, value in PRAGMAS.items():
+            if self.readonly and name == "journal_mode":
+                continue   # only a writer can switch the journal mode
+            conn.execute(f"PRAGMA {name}={value}").fetchall()
+        if self.readonly:
+            conn.execute("PRAGMA query_only=1")
+        return conn
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(db_path, readonly=False):
+    """
+    Returns the shared pool for db_path: one read-write pool, by default
+    with a single connection so writers queue up here instead of fighting
+    over the database lock (DB_WRITE_POOL_SIZE raises it), and one
+    read-only pool of DB_READ_POOL_SIZE connections for parallel readers.
+    """
+    path = os.path.abspath(db_path)
+    with _pools_lock:
+        if (path, False) not in _pools:
+            _pools[(path, False)] = ConnectionPool(path, size=int(os.environ.get("DB_WRITE_POOL_SIZE", "1")))
+        if readonly and (path, True) not in _pools:
+            writer = _pools[(path, False)]
+            if writer.opened == 0:
+                # Readers can't switch the database to WAL; a writer does it
+                writer.release(writer.acquire())
+            _pools[(path, True)] = ConnectionPool(path, size=int(os.environ.get("DB_READ_POOL_SIZE", "4")),
+                                                  readonly=True)
+        return _pools[(path, readonly)]
+
+
 class DatabaseConnection:
     """
     Custom context manager to handle opening and closing
     a SQLite database connection.
+
+    With pooled=True the connection is checked out of a shared pool of
+    tuned connections (see PRAGMAS) and handed back on exit instead of
+    being opened and closed every time; readonly=True picks the read-only
+    pool. Either way, changes that weren't committed are discarded on exit.
     """
-    def __init__(self, db_path):
+    def __init__(self, db_path, pooled=False, readonly=False):
         self.db_path = db_path
+        self.pooled = pooled
+        self.readonly = readonly
+        self.pool = None
         self.conn = None
 
     def __enter__(self):
-        self.conn = sqlite3.connect(self.db_path)
+        if self.pooled:
+            self.pool = get_pool(self.db_path, self.readonly)
+            self.conn = self.pool.acquire()
+        else:
+            self.conn = sqlite3.connect(self.db_path)
         return self.conn
 
     def __exit__(self, exc_type, exc_value, traceback):
         if self.conn:
-            self.conn.close()
-            print("✅ Database connection closed.")
+            if self.pool:
+                self.pool.release(self.conn)
+            else:
+                self.conn.close()
+                print("✅ Database connection closed.")
+            self.conn = None
+
+
+def _benchmark(rounds=10000):
+    import io
+    import contextlib
+
+    def run(**options):
+        start = time.perf_counter()
+        for _ in range(rounds):
+            with DatabaseConnection(DB_PATH, **options) as conn:
+                conn.execute("SELECT * FROM users WHERE id = ?", (1,)).fetchone()
+        return rounds / (time.perf_counter() - start)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        plain = run()
+    print(f"⏱️  connect per block: {plain:9.0f} blocks/s")
+    print(f"⏱️  pooled, read-only: {run(pooled=True, readonly=True):9.0f} blocks/s")
+
 
 # Use the context manager to query the database
 if __name__ == "__main__":
@@ -34,4 +203,6 @@ if __name__ == "__main__":
 
         print("📋 Users in the database:")
         for user in results:
-            print(user)
\ No newline at end of file
+            print(user)
+
+    _benchmark()
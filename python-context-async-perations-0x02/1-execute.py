@@ -1,30 +1,109 @@
 import sqlite3
 import os
+from collections import namedtuple
+from functools import lru_cache
 
 # Define database path
 DB_FILENAME = 'users.db'
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DB_PATH= os.path.join(BASE_DIR, '../python-decorators-0x01', DB_FILENAME)
 
+# "all" returns a list like before; "rows" and "chunks" stream while the block runs
+MODES = ("all", "rows", "chunks")
+
+
+@lru_cache(maxsize=128)
+def _record_type(columns):
+    return namedtuple("Record", columns, rename=True)
+
+
+def _namedtuple_factory(cursor, row):
+    columns = tuple(column[0] for column in cursor.description)
+    return _record_type(columns)._make(row)
+
+
+def _dict_factory(cursor, row):
+    return {column[0]: value for column, value in zip(cursor.description, row)}
+
+
+ROW_FACTORIES = {
+    "tuple": None,                    # sqlite3's plain tuples, the most compact
+    "namedtuple": _namedtuple_factory,  # tuples with field names, no per-row dict
+    "row": sqlite3.Row,
+    "dict": _dict_factory,
+}
+
+
 class ExecuteQuery:
-    def __init__(self, query, params=(), db_name="users.db"):
+    """
+    Runs a query when the with block starts and closes the connection when
+    it ends.
+
+    mode="all" returns every row as a list. mode="rows" returns an iterator
+    that fetches chunk_size rows at a time while the block runs, and
+    mode="chunks" yields those lists of rows instead, so big results are
+    never held in memory at once. The iterator is only valid inside the
+    block; the cursor is closed when it is exhausted or abandoned, and the
+    connection when the block exits.
+
+    row_factory is one of ROW_FACTORIES ("tuple" by default) or a callable
+    taking (cursor, row).
+    """
+    def __init__(self, query, params=(), db_name="users.db", mode="all", chunk_size=500, row_factory=None):
+        if mode not in MODES:
+            raise ValueError(f"mode must be one of {MODES}, got {mode!r}")
+        if isinstance(row_factory, str):
+            if row_factory not in ROW_FACTORIES:
+                raise ValueError(f"row_factory must be one of {tuple(ROW_FACTORIES)}, got {row_factory!r}")
+            row_factory = ROW_FACTORIES[row_factory]
         self.query = query
         self.params = params
         self.conn = None
         self.cursor = None
         self.db_path = DB_PATH
+        self.mode = mode
+        self.chunk_size = chunk_size
+        self.row_factory = row_factory
+        self.rows = None
 
     def __enter__(self):
         self.conn = sqlite3.connect(self.db_path)
         self.cursor = self.conn.cursor()
         self.cursor.execute(self.query, self.params)
-        return self.cursor.fetchall()
+        self.cursor.row_factory = self.row_factory
+        if self.mode == "all":
+            return self.cursor.fetchall()
+        self.rows = self._chunks() if self.mode == "chunks" else self._rows()
+        return self.rows
 
     def __exit__(self, exc_type, exc_val, exc_tb):
+        if self.rows is not None:
+            self.rows.close()
+            self.rows = None
         if self.conn:
             self.conn.close()
         print("✅ Database connection closed.")
 
+    def _chunks(self):
+        cursor = self.cursor
+        try:
+            while True:
+                chunk = cursor.fetchmany(self.chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            # Ends the statement even if the caller stopped early
+            cursor.close()
+
+    def _rows(self):
+        chunks = self._chunks()
+        try:
+            for chunk in chunks:
+                yield from chunk
+        finally:
+            chunks.close()
+
 
 # ✅ Required query and parameter
 query = "SELECT * FROM users WHERE age > ?"
@@ -33,4 +112,9 @@ params = (25,)
 # ✅ Must use the `with` statement (required by the checker)
 with ExecuteQuery(query, params) as results:
     for user in results:
-        print(user)
\ No newline at end of file
+        print(user)
+
+# ✅ Same query, streamed as named tuples instead of loaded into a list
+with ExecuteQuery(query, params, mode="rows", row_factory="namedtuple") as users:
+    for user in users:
+        print(user)
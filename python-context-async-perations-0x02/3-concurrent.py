@@ -1,6 +1,9 @@
 import aiosqlite
 import asyncio
 import os
+from collections import namedtuple
+from contextlib import asynccontextmanager
+from urllib.request import pathname2url
 
 # Define database path
 DB_FILENAME = 'users.db'
@@ -34,6 +37,124 @@ async def fetch_concurrently():
         async_fetch_older_users()
     )
 
+
+# One read in a fan-out; timeout (seconds) overrides fan_out's default
+Query = namedtuple("Query", "sql params timeout", defaults=((), None))
+
+
+class AsyncConnectionPool:
+    """
+    Keeps up to size aiosqlite connections open for reuse, so a fan-out of
+    many reads doesn't pay for a new connection (and thread) per query.
+    Connections are opened read-only, so they never take the write lock;
+    they read alongside a writer once a read-write connection has put the
+    database in WAL mode, which a read-only one cannot do.
+    Must be closed with `await pool.close()` before the event loop ends.
+    """
+    def __init__(self, db_path=DB_PATH, size=8):
+        self.db_path = os.path.abspath(db_path)
+        self.size = size
+        self.idle = []
+        self.slots = asyncio.Semaphore(size)
+
+    @asynccontextmanager
+    async def connection(self):
+        async with self.slots:
+            db = self.idle.pop() if self.idle else await self._connect()
+            try:
+                yield db
+            except BaseException:
+                # The connection may still be busy with a cancelled query
+                await db.close()
+                raise
+            else:
+                self.idle.append(db)
+
+    async def close(self):
+        idle, self.idle = self.idle, []
+        for db in idle:
+            await db.close()
+
+    async def _connect(self):
+        db = await aiosqlite.connect(f"file:{pathname2url(self.db_path)}?mode=ro", uri=True)
+        await db.execute("PRAGMA query_only=1")
+        await db.execute("PRAGMA mmap_size=268435456")
+        return db
+
+
+async def fan_out(queries, concurrency=8, timeout=None, pool=None, return_exceptions=False):
+    """
+    Runs every query concurrently, at most `concurrency` at a time, and
+    yields (index, rows) pairs in the order the queries finish.
+
+    queries are Query tuples, (sql, params) tuples or plain SQL strings.
+    A query still running after its timeout is interrupted and fails with
+    asyncio.TimeoutError; cancelled queries are interrupted as well. With
+    return_exceptions=True, failures are yielded as (index, exception)
+    instead of raised. Leaving the loop early, or cancelling the task
+    consuming it, cancels the queries still pending.
+    """
+    queries = [Query(q) if isinstance(q, str) else Query(*q) for q in queries]
+    own_pool = pool is None
+    if own_pool:
+        pool = AsyncConnectionPool(size=concurrency)
+    limit = asyncio.Semaphore(concurrency)
+
+    async def run(index, query):
+        try:
+            async with limit:
+                async with pool.connection() as db:
+                    try:
+                        rows = await asyncio.wait_for(db.execute_fetchall(query.sql, query.params),
+                                                      timeout if query.timeout is None else query.timeout)
+                    except (asyncio.TimeoutError, asyncio.CancelledError):
+                        # Stop the query in SQLite too, not just the wait for it
+                        await db.interrupt()
+                        raise
+        except Exception as e:
+            return index, None, e
+        return index, rows, None
+
+    tasks = [asyncio.ensure_future(run(i, q)) for i, q in enumerate(queries)]
+    try:
+        for done in asyncio.as_completed(tasks):
+            index, rows, error = await done
+            if error is None:
+                yield index, rows
+            elif return_exceptions:
+                yield index, error
+            else:
+                raise error
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if own_pool:
+            await pool.close()
+
+
+async def fetch_all(queries, **options):
+    """Runs the queries like fan_out and returns their results in query order."""
+    results = [None] * len(queries)
+    async for index, rows in fan_out(queries, **options):
+        results[index] = rows
+    return results
+
+
+# A dashboard of independent reads, overlapped on one pool
+async def load_dashboard():
+    queries = [("SELECT * FROM users WHERE id = ?", (i % 3 + 1,)) for i in range(30)]
+    queries.append(Query("SELECT COUNT(*) FROM users", timeout=0.5))
+    pool = AsyncConnectionPool(size=8)
+    try:
+        async for index, rows in fan_out(queries, concurrency=8, timeout=2.0, pool=pool,
+                                         return_exceptions=True):
+            print(f"📊 query {index:>2} done: {rows}")
+    finally:
+        await pool.close()
+
+
 # Run the async tasks
 if __name__ == "__main__":
-    asyncio.run(fetch_concurrently())
\ No newline at end of file
+    asyncio.run(fetch_concurrently())
+    asyncio.run(load_dashboard())
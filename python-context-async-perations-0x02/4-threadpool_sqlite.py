@@ -0,0 +1,179 @@
+import asyncio
+import os
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.request import pathname2url
+
+# Define database path
+DB_FILENAME = 'users.db'
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DB_PATH= os.path.join(BASE_DIR, '../python-decorators-0x01', DB_FILENAME)
+
+
+class ThreadPoolDatabase:
+    """
+    Async access to SQLite without a thread per connection.
+
+    Reads run on a fixed pool of `readers` threads, each holding one
+    long-lived read-only connection, so up to `readers` queries run in
+    parallel (sqlite3 releases the GIL while SQLite works). All writes go
+    through a single writer thread with its own connection: its queue
+    serializes them, so writers never fight over the database lock, and
+    WAL lets the readers carry on meanwhile.
+
+    Use it as `async with ThreadPoolDatabase(path) as db:` or call
+    `await db.close()` when done.
+    """
+    def __init__(self, db_path=DB_PATH, readers=4):
+        self.db_path = os.path.abspath(db_path)
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+        self._writer = ThreadPoolExecutor(1, "sqlite-writer", initializer=self._open, initargs=(False,))
+        # Open the writer first so that the database is in WAL mode for the readers
+        self._writer.submit(lambda: None).result()
+        self._readers = ThreadPoolExecutor(readers, "sqlite-reader", initializer=self._open, initargs=(True,))
+
+    async def fetchall(self, sql, params=()):
+        return await self._run(self._readers, self._fetchall, sql, params)
+
+    async def fetchone(self, sql, params=()):
+        return await self._run(self._readers, self._fetchone, sql, params)
+
+    async def execute(self, sql, params=()):
+        """Runs one write statement in its own transaction; returns the number of rows changed."""
+        return await self._run(self._writer, self._write, sql, params, False)
+
+    async def executemany(self, sql, seq_of_params):
+        return await self._run(self._writer, self._write, sql, list(seq_of_params), True)
+
+    async def transaction(self, func, *args):
+        """
+        Runs func(conn, *args) on the writer thread inside one transaction,
+        committed if it returns and rolled back if it raises.
+        """
+        return await self._run(self._writer, self._transaction, func, args)
+
+    async def close(self):
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self._shutdown)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    @staticmethod
+    async def _run(executor, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(executor, func, *args)
+
+    def _open(self, readonly):
+        # Runs once on every pool thread
+        if readonly:
+            conn = sqlite3.connect(f"file:{pathname2url(self.db_path)}?mode=ro", uri=True,
+                                   check_same_thread=False)
+            conn.execute("PRAGMA query_only=1")
+        else:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL").fetchall()
+            conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=5000")
+        conn.execute("PRAGMA mmap_size=268435456")
+        self._local.conn = conn
+        with self._lock:
+            self._connections.append(conn)
+
+    def _fetchall(self, sql, params):
+        return self._local.conn.execute(sql, params).fetchall()
+
+    def _fetchone(self, sql, params):
+        return self._local.conn.execute(sql, params).fetchone()
+
+    def _write(self, sql, params, many):
+        conn = self._local.conn
+        with conn:
+            cursor = conn.executemany(sql, params) if many else conn.execute(sql, params)
+        return cursor.rowcount
+
+    def _transaction(self, func, args):
+        conn = self._local.conn
+        with conn:
+            return func(conn, *args)
+
+    def _shutdown(self):
+        self._readers.shutdown()
+        self._writer.shutdown()
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            conn.close()
+
+
+def _create_benchmark_db(path, rows):
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE users (id INTEGER PRIMARY KEY, name TEXT NOT NULL, email TEXT NOT NULL, age INTEGER)")
+    conn.executemany("INSERT INTO users VALUES (?, ?, ?, ?)",
+                     [(i, f"User {i}", f"user{i}@example.com", 18 + i % 60) for i in range(1, rows + 1)])
+    conn.commit()
+    conn.close()
+
+
+async def _benchmark(calls=2000, concurrency=64, rows=10000):
+    import time
+    import tempfile
+    import aiosqlite
+
+    def query(i):
+        if i % 10 == 0:
+            return "UPDATE users SET age = age + 1 WHERE id = ?", (i % rows + 1,)
+        return "SELECT * FROM users WHERE id = ?", (i % rows + 1,)
+
+    async def per_call_connect(i):
+        sql, params = query(i)
+        async with aiosqlite.connect(path, timeout=30) as db:
+            if sql.startswith("UPDATE"):
+                await db.execute(sql, params)
+                await db.commit()
+            else:
+                await db.execute_fetchall(sql, params)
+
+    async def thread_pool(i):
+        sql, params = query(i)
+        if sql.startswith("UPDATE"):
+            await db.execute(sql, params)
+        else:
+            await db.fetchall(sql, params)
+
+    async def run(label, call):
+        limit = asyncio.Semaphore(concurrency)
+
+        async def limited(i):
+            async with limit:
+                await call(i)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(limited(i) for i in range(calls)))
+        elapsed = time.perf_counter() - start
+        print(f"⏱️  {label:<26} {calls / elapsed:8.0f} queries/s (10% writes, {concurrency} tasks)")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        _create_benchmark_db(path, rows)
+        await run("aiosqlite.connect per call", per_call_connect)
+        async with ThreadPoolDatabase(path, readers=4) as db:
+            await run("ThreadPoolDatabase", thread_pool)
+
+
+async def main():
+    async with ThreadPoolDatabase(DB_PATH) as db:
+        users = await db.fetchall("SELECT * FROM users")
+        print("👥 All Users:")
+        for user in users:
+            print(user)
+    await _benchmark()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,37 +1,263 @@
+import re
+import sys
+import json
+import time
+import queue
+import atexit
+import random
+import inspect
 import sqlite3
+import logging
 import functools
-from datetime import datetime
+import threading
+from logging.handlers import QueueHandler, QueueListener
+
+#### structured query log, written by a background thread
+
+query_logger = logging.getLogger("queries")
+query_logger.setLevel(logging.INFO)
+query_logger.propagate = False
+
+
+class JSONFormatter(logging.Formatter):
+    """Formats query records as one JSON object per line."""
+
+    def format(self, record):
+        entry = {"time": self.formatTime(record), "level": record.levelname}
+        entry.update(getattr(record, "query", {}))
+        return json.dumps(entry)
+
+
+def start_query_logging(*handlers):
+    """
+    Sends the query log through a queue to the given handlers (JSON lines on
+    stderr by default). The decorated functions only put records on the
+    queue; formatting and writing happen on the listener's thread.
+
+    Called with the defaults by the first decorated call that logs, unless
+    it was called before.
+    """
+    global _listener, _configured
+    _configured = True
+    stop_query_logging()
+    if not handlers:
+        stream = logging.StreamHandler(sys.stderr)
+        stream.setFormatter(JSONFormatter())
+        handlers = (stream,)
+    log_queue = queue.SimpleQueue()
+    for handler in list(query_logger.handlers):
+        query_logger.removeHandler(handler)
+    query_logger.addHandler(QueueHandler(log_queue))
+    _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+
+
+def stop_query_logging():
+    """Flushes the queue and stops the listener thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def _ensure_query_logging():
+    if not _configured:
+        with _configure_lock:
+            if not _configured:
+                start_query_logging()
+
+
+_listener = None
+_configured = False
+_configure_lock = threading.Lock()
+atexit.register(stop_query_logging)
+
+#### SQL fingerprints
+
+_COMMENTS = re.compile(r"--[^\n]*|/\*.*?\*/", re.S)
+_LITERALS = re.compile(r"\bx'[0-9a-f]*'|'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b", re.I)
+_IN_LISTS = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_SPACES = re.compile(r"\s+")
+
+
+@functools.lru_cache(maxsize=4096)
+def fingerprint(query):
+    """
+    Normalizes a query so that executions differing only in their literals
+    or parameters share one fingerprint:
+    "SELECT * FROM users WHERE id = 7" -> "select * from users where id = ?"
+    """
+    query = _COMMENTS.sub(" ", query)
+    query = _LITERALS.sub("?", query)
+    query = _IN_LISTS.sub("(?+)", query)
+    return _SPACES.sub(" ", query).strip().lower()
+
+#### per-fingerprint latency histograms
+
+
+class QueryStats:
+    """
+    Latency histogram of one fingerprint. Bucket i counts durations of up
+    to 2**i microseconds, so a few dozen integers cover 1us to hours.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.total_us = 0.0
+        self.max_us = 0.0
+        self.rows = 0
+        self.buckets = {}
+
+    def add(self, duration_us, rows):
+        self.count += 1
+        self.total_us += duration_us
+        if duration_us > self.max_us:
+            self.max_us = duration_us
+        if rows:
+            self.rows += rows
+        bucket = int(duration_us).bit_length()
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+
+    def percentile(self, p):
+        """Upper bound, in milliseconds, of the bucket holding the p-th percentile."""
+        rank = p / 100 * self.count
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                return min(2 ** bucket, self.max_us) / 1000
+        return self.max_us / 1000
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "rows": self.rows,
+            "total_ms": self.total_us / 1000,
+            "mean_ms": self.total_us / self.count / 1000,
+            "p50_ms": self.percentile(50),
+            "p95_ms": self.percentile(95),
+            "p99_ms": self.percentile(99),
+            "max_ms": self.max_us / 1000,
+            "histogram": {f"<={2 ** b}us": n for b, n in sorted(self.buckets.items())},
+        }
+
+
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def dump_query_stats(reset=False):
+    """
+    Returns the latency summary of every fingerprint seen so far, slowest
+    total time first. With reset=True the histograms start over.
+    """
+    global _stats
+    with _stats_lock:
+        stats = _stats
+        if reset:
+            _stats = {}
+        summaries = {fp: s.summary() for fp, s in stats.items()}
+    return dict(sorted(summaries.items(), key=lambda item: -item[1]["total_ms"]))
 
 #### decorator to log SQL queries
 
-def log_queries(func):
+
+def _find_query(args, kwargs):
+    if args and isinstance(args[0], str):
+        return args[0]
+    return kwargs.get('query')
+
+
+def _row_count(result):
+    if isinstance(result, (list, tuple)):
+        return len(result)
+    rowcount = getattr(result, "rowcount", -1)
+    return rowcount if isinstance(rowcount, int) and rowcount >= 0 else None
+
+
+def _record(func, query, start, result, error, caller, sample_rate, slow_ms):
+    duration_us = (time.perf_counter_ns() - start) / 1000
+    key = fingerprint(query)
+    rows = _row_count(result)
+    with _stats_lock:
+        stats = _stats.get(key)
+        if stats is None:
+            stats = _stats[key] = QueryStats()
+        stats.add(duration_us, rows)
+
+    slow = slow_ms is not None and duration_us >= slow_ms * 1000
+    if slow or error or sample_rate >= 1.0 or random.random() < sample_rate:
+        _ensure_query_logging()
+        query_logger.log(logging.WARNING if slow or error else logging.INFO, "query", extra={"query": {
+            "fingerprint": key,
+            "duration_ms": round(duration_us / 1000, 3),
+            "rows": rows,
+            "function": func.__qualname__,
+            "caller": f"{caller.f_code.co_filename}:{caller.f_lineno}",
+            "error": error,
+        }})
+
+
+def log_queries(func=None, *, sample_rate=1.0, slow_ms=None):
     """
-    Decorator that logs SQL queries before they are executed.
+    Decorator that times SQL queries and logs them as structured records.
     Assumes the first argument of the decorated function is the SQL query.
+
+    Every call is added to the latency histogram of its query fingerprint
+    (see dump_query_stats). A log record with the fingerprint, duration,
+    row count and caller is queued for sample_rate of the calls, and for
+    every call slower than slow_ms. Can be used bare (@log_queries) or with
+    arguments (@log_queries(sample_rate=0.01, slow_ms=50)), on plain and
+    on coroutine functions.
     """
+    if func is None:
+        return functools.partial(log_queries, sample_rate=sample_rate, slow_ms=slow_ms)
+
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            query = _find_query(args, kwargs)
+            if query is None:
+                return await func(*args, **kwargs)
+
+            caller = sys._getframe(1)
+            start = time.perf_counter_ns()
+            error = None
+            result = None
+            try:
+                result = await func(*args, **kwargs)
+                return result
+            except BaseException as exc:
+                error = type(exc).__name__
+                raise
+            finally:
+                _record(func, query, start, result, error, caller, sample_rate, slow_ms)
+
+        return async_wrapper
+
     @functools.wraps(func)
     def wrapper(*args, **kwargs):
         # Extract the query from arguments
-        if args:
-            query = args[0] if isinstance(args[0], str) else None
-        elif 'query' in kwargs:
-            query = kwargs['query']
-        else:
-            query = None
-        
-        # Log the query if found
-        if query:
-            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            print(f"[{timestamp}] Executing SQL Query: {query}")
-        else:
-            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            print(f"[{timestamp}] No SQL query found to log")
-        
-        # Execute the original function
-        return func(*args, **kwargs)
-    
+        query = _find_query(args, kwargs)
+        if query is None:
+            return func(*args, **kwargs)
+
+        start = time.perf_counter_ns()
+        error = None
+        result = None
+        try:
+            result = func(*args, **kwargs)
+            return result
+        except BaseException as exc:
+            error = type(exc).__name__
+            raise
+        finally:
+            _record(func, query, start, result, error, sys._getframe(1), sample_rate, slow_ms)
+
     return wrapper
 
+
+
 @log_queries
 def fetch_all_users(query):
     conn = sqlite3.connect('users.db')
@@ -42,4 +268,4 @@ def fetch_all_users(query):
     return results
 
 #### fetch users while logging the query
-users = fetch_all_users(query="SELECT * FROM users")
\ No newline at end of file
+users = fetch_all_users(query="SELECT * FROM users")
@@ -1,38 +1,48 @@
 #!/usr/bin/env python3
 """Module that provides a decorator for automatic database connection handling"""
 
+import asyncio
 import sqlite3 
+import inspect
 import functools
 from typing import Callable, Any
 
+from connection_pool import close_async_pools, get_async_pool, get_pool
+
 
 def with_db_connection(func: Callable) -> Callable:
     """Decorator that automatically handles opening and closing database connections.
     
     This decorator:
-    1. Opens a database connection
+    1. Checks a connection out of the process-wide pool for users.db
     2. Passes the connection as the first argument to the decorated function
-    3. Closes the connection after the function execution
+    3. Returns the connection to the pool after the function execution
     4. Allows the decorated function to be called without providing the connection
     
+    Coroutine functions get an aiosqlite connection from the running event
+    loop's pool instead (see AsyncSQLitePool) and are awaited.
+    
     Args:
         func: The function to decorate
         
     Returns:
         Callable: The decorated function
     """
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            async with get_async_pool('users.db').connection() as conn:
+                return await func(conn, *args, **kwargs)
+        
+        return async_wrapper
+    
     @functools.wraps(func)
     def wrapper(*args, **kwargs):
-        # Open a database connection
-        conn = sqlite3.connect('users.db')
-        
-        try:
+        # Check out a pooled connection; it goes back to the pool even if an
+        # exception occurs, with any uncommitted transaction rolled back
+        with get_pool('users.db').connection() as conn:
             # Pass the connection as the first argument
-            result = func(conn, *args, **kwargs)
-            return result
-        finally:
-            # Ensure the connection is closed even if an exception occurs
-            conn.close()
+            return func(conn, *args, **kwargs)
     
     return wrapper
 
@@ -44,6 +54,48 @@ def get_user_by_id(conn, user_id):
     return cursor.fetchone() 
 
 
+@with_db_connection
+async def aget_user_by_id(conn, user_id):
+    async with conn.execute("SELECT * FROM users WHERE id = ?", (user_id,)) as cursor:
+        return await cursor.fetchone()
+
+
+def _benchmark(lookups: int = 5000, concurrency: int = 64) -> None:
+    import time
+    import aiosqlite
+
+    start = time.perf_counter()
+    for i in range(lookups):
+        get_user_by_id(user_id=1 + i % 3)
+    print(f"sync, one at a time       {lookups / (time.perf_counter() - start):10.0f} lookups/s")
+
+    async def run():
+        limit = asyncio.Semaphore(concurrency)
+
+        async def lookup(i):
+            async with limit:
+                return await aget_user_by_id(user_id=1 + i % 3)
+
+        async def unpooled_lookup(i):
+            # What 3-concurrent.py does today: a new connection per query
+            async with limit:
+                async with aiosqlite.connect('users.db') as conn:
+                    async with conn.execute("SELECT * FROM users WHERE id = ?", (1 + i % 3,)) as cursor:
+                        return await cursor.fetchone()
+
+        start = time.perf_counter()
+        await asyncio.gather(*(unpooled_lookup(i) for i in range(lookups)))
+        print(f"async, connect per lookup {lookups / (time.perf_counter() - start):10.0f} lookups/s")
+
+        await aget_user_by_id(user_id=1)
+        start = time.perf_counter()
+        await asyncio.gather(*(lookup(i) for i in range(lookups)))
+        print(f"async, pooled             {lookups / (time.perf_counter() - start):10.0f} lookups/s")
+        await close_async_pools()
+
+    asyncio.run(run())
+
+
 if __name__ == "__main__":
     # Create test database and table
     conn = sqlite3.connect('users.db')
@@ -66,4 +118,14 @@ if __name__ == "__main__":
     
     # Fetch user by ID with automatic connection handling 
     user = get_user_by_id(user_id=1)
-    print(user)
\ No newline at end of file
+    print(user)
+    
+    # Same lookups from many tasks on one event loop
+    async def fetch_user():
+        try:
+            return await aget_user_by_id(user_id=1)
+        finally:
+            await close_async_pools()
+    
+    print(asyncio.run(fetch_user()))
+    _benchmark()
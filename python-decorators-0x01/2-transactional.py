@@ -1,38 +1,53 @@
 #!/usr/bin/env python3
 """Module that provides decorators for database connection and transaction handling"""
 
+import time
+import queue
 import sqlite3 
+import inspect
 import functools
-from typing import Callable, Any
+import threading
+from concurrent.futures import Future
+from typing import Callable, Any, Dict, List, Optional, Tuple
+
+from connection_pool import get_async_pool, get_pool
+from db_cache import (adatabase_identity, ainvalidate_tables, async_track_writes, database_identity,
+                      invalidate_tables, track_writes)
 
 
 def with_db_connection(func: Callable) -> Callable:
     """Decorator that automatically handles opening and closing database connections.
     
     This decorator:
-    1. Opens a database connection
+    1. Checks a connection out of the process-wide pool for users.db
     2. Passes the connection as the first argument to the decorated function
-    3. Closes the connection after the function execution
+    3. Returns the connection to the pool after the function execution
     4. Allows the decorated function to be called without providing the connection
     
+    Coroutine functions get an aiosqlite connection from the running event
+    loop's pool instead (see AsyncSQLitePool) and are awaited.
+    
     Args:
         func: The function to decorate
         
     Returns:
         Callable: The decorated function
     """
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            async with get_async_pool('users.db').connection() as conn:
+                return await func(conn, *args, **kwargs)
+        
+        return async_wrapper
+    
     @functools.wraps(func)
     def wrapper(*args, **kwargs):
-        # Open a database connection
-        conn = sqlite3.connect('users.db')
-        
-        try:
+        # Check out a pooled connection; it goes back to the pool even if an
+        # exception occurs, with any uncommitted transaction rolled back
+        with get_pool('users.db').connection() as conn:
             # Pass the connection as the first argument
-            result = func(conn, *args, **kwargs)
-            return result
-        finally:
-            # Ensure the connection is closed even if an exception occurs
-            conn.close()
+            return func(conn, *args, **kwargs)
     
     return wrapper
 
@@ -45,6 +60,11 @@ def transactional(func: Callable) -> Callable:
     2. Executes the function within the transaction
     3. Commits the transaction if the function completes successfully
     4. Rolls back the transaction if an exception occurs
+    5. After a commit, invalidates cached query results (see db_cache)
+       read from the tables the transaction wrote to
+    
+    For coroutine functions the connection is an aiosqlite connection and
+    the commit or rollback is awaited.
     
     Args:
         func: The function to decorate
@@ -52,14 +72,31 @@ def transactional(func: Callable) -> Callable:
     Returns:
         Callable: The decorated function
     """
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(conn, *args, **kwargs):
+            try:
+                async with async_track_writes(conn) as written_tables:
+                    result = await func(conn, *args, **kwargs)
+                await conn.commit()
+                await ainvalidate_tables(await adatabase_identity(conn), written_tables)
+                return result
+            except BaseException:
+                await conn.rollback()
+                raise
+        
+        return async_wrapper
+    
     @functools.wraps(func)
     def wrapper(conn, *args, **kwargs):
         try:
             # Execute the function within a transaction
-            result = func(conn, *args, **kwargs)
+            with track_writes(conn) as written_tables:
+                result = func(conn, *args, **kwargs)
             
             # If no exception occurs, commit the transaction
             conn.commit()
+            invalidate_tables(database_identity(conn), written_tables)
             return result
         except Exception as e:
             # If an exception occurs, roll back the transaction
@@ -70,6 +107,215 @@ def transactional(func: Callable) -> Callable:
     return wrapper
 
 
+class GroupCommitWriter:
+    """Applies write units from many threads in shared transactions.
+    
+    The writer:
+    1. Owns one pooled connection and a background thread
+    2. Takes units queued by submit() and groups them into a batch of at
+       most max_batch units, waiting at most max_latency seconds after the
+       oldest unit was queued for more units to arrive. With the default
+       of 0 a batch is whatever queued up while the previous one committed,
+       so a lone writer is never delayed
+    3. Runs every unit of the batch inside its own SAVEPOINT, so a unit
+       that raises is rolled back on its own and doesn't affect the others
+    4. Commits the batch once, then resolves each unit's Future with its
+       own result or exception and invalidates cached query results
+    
+    One commit (and, depending on synchronous, one fsync) is shared by the
+    whole batch instead of being paid by every small update. A unit is a
+    function taking the connection as its first argument, like those
+    decorated with transactional; it must not commit or roll back itself.
+
+    If the writer can't get its connection, it closes itself: every unit
+    queued or submitted afterwards fails with the connection error.
+    """
+
+    def __init__(self, database: str = 'users.db', max_batch: int = 256, max_latency: float = 0.0):
+        self.database = database
+        self.max_batch = max_batch
+        self.max_latency = max_latency
+        self.batches = 0
+        self.units = 0
+        self.failed_units = 0
+        self._queue: "queue.Queue[Optional[Tuple[float, Callable, tuple, dict, Future]]]" = queue.Queue()
+        self._closed = False
+        self._error: Optional[BaseException] = None
+        self._closing_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name=f"group-commit-{database}", daemon=True)
+        self._thread.start()
+
+    def submit(self, func: Callable, *args: Any, **kwargs: Any) -> Future:
+        """Queue func(conn, *args, **kwargs); the Future resolves once its batch commits."""
+        future: Future = Future()
+        # Under the lock so that no unit can be queued behind close()'s sentinel
+        with self._closing_lock:
+            if self._error is not None:
+                future.set_exception(self._error)
+            elif self._closed:
+                raise RuntimeError("GroupCommitWriter is closed")
+            else:
+                self._queue.put((time.monotonic(), func, args, kwargs, future))
+        return future
+
+    @property
+    def closed(self) -> bool:
+        """True once close() was called or the writer failed to connect."""
+        return self._closed
+
+    def close(self) -> None:
+        """Apply the units already queued, then stop the writer thread."""
+        with self._closing_lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(None)
+        self._thread.join()
+        self._fail_queued(RuntimeError("GroupCommitWriter closed before applying the unit"))
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "batches": self.batches,
+            "units": self.units,
+            "failed_units": self.failed_units,
+            "mean_batch_size": self.units / self.batches if self.batches else 0.0,
+        }
+
+    def _run(self) -> None:
+        pool = get_pool(self.database)
+        try:
+            conn = pool.acquire()
+        except Exception as e:
+            with self._closing_lock:
+                self._closed = True
+                self._error = e
+            self._fail_queued(e)
+            return
+        try:
+            while True:
+                batch, stop = self._next_batch()
+                if batch:
+                    self._apply(conn, batch)
+                if stop:
+                    return
+        finally:
+            pool.release(conn)
+
+    def _fail_queued(self, error: BaseException) -> None:
+        # Called once no more units can be queued
+        while True:
+            try:
+                unit = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            if unit is not None and unit[4].set_running_or_notify_cancel():
+                unit[4].set_exception(error)
+
+    def _next_batch(self) -> Tuple[List[tuple], bool]:
+        first = self._queue.get()
+        if first is None:
+            return [], True
+        batch = [first]
+        deadline = first[0] + self.max_latency
+        while len(batch) < self.max_batch:
+            try:
+                unit = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                break
+            if unit is None:
+                return batch, True
+            batch.append(unit)
+        return batch, False
+
+    def _apply(self, conn: sqlite3.Connection, batch: List[tuple]) -> None:
+        outcomes: List[Tuple[Future, bool, Any]] = []
+        try:
+            with track_writes(conn) as written_tables:
+                conn.execute("BEGIN IMMEDIATE")
+                for _, func, args, kwargs, future in batch:
+                    if not future.set_running_or_notify_cancel():
+                        continue
+                    conn.execute("SAVEPOINT unit")
+                    try:
+                        result = func(conn, *args, **kwargs)
+                    except Exception as e:
+                        conn.execute("ROLLBACK TO unit")
+                        outcomes.append((future, False, e))
+                    else:
+                        outcomes.append((future, True, result))
+                    conn.execute("RELEASE unit")
+            conn.commit()
+        except Exception as e:
+            # The batch as a whole failed (e.g. the commit): every unit that
+            # had succeeded reports the batch's error instead
+            if conn.in_transaction:
+                conn.rollback()
+            outcomes = [(future, False, value if not ok else e) for future, ok, value in outcomes]
+            started = {id(future) for future, _, _ in outcomes}
+            outcomes += [(unit[4], False, e) for unit in batch
+                         if id(unit[4]) not in started and unit[4].running()]
+        else:
+            invalidate_tables(database_identity(conn), written_tables)
+
+        self.batches += 1
+        self.units += len(outcomes)
+        for future, ok, value in outcomes:
+            if ok:
+                future.set_result(value)
+            else:
+                self.failed_units += 1
+                future.set_exception(value)
+
+
+_writers: Dict[str, GroupCommitWriter] = {}
+_writers_lock = threading.Lock()
+
+
+def get_group_writer(database: str = 'users.db', **writer_kwargs: Any) -> GroupCommitWriter:
+    """Return the process-wide GroupCommitWriter for database, starting it on first use.
+
+    A writer that has closed, e.g. because it could not connect, is replaced
+    by a new one.
+    """
+    with _writers_lock:
+        writer = _writers.get(database)
+        if writer is None or writer.closed:
+            writer = _writers[database] = GroupCommitWriter(database, **writer_kwargs)
+        return writer
+
+
+def group_commit(func: Optional[Callable] = None, *, database: str = 'users.db') -> Callable:
+    """Decorator that runs a write through the group-commit writer.
+    
+    This decorator:
+    1. Replaces with_db_connection + transactional for small, frequent writes
+    2. Queues the call on the GroupCommitWriter of database, which passes
+       its connection as the first argument
+    3. Blocks until the batch containing the call has committed
+    4. Returns the function's result, or raises its exception; a failing
+       call is rolled back to its savepoint without affecting other callers
+    
+    The decorated function also gets a submit(*args, **kwargs) attribute
+    that returns the Future instead of waiting for it.
+    
+    Args:
+        func: The function to decorate
+        database: Database file the writes go to (default: users.db)
+        
+    Returns:
+        Callable: The decorated function
+    """
+    if func is None:
+        return functools.partial(group_commit, database=database)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        return get_group_writer(database).submit(func, *args, **kwargs).result()
+
+    wrapper.submit = lambda *args, **kwargs: get_group_writer(database).submit(func, *args, **kwargs)
+    return wrapper
+
+
 @with_db_connection 
 @transactional 
 def update_user_email(conn, user_id, new_email): 
@@ -77,6 +323,22 @@ def update_user_email(conn, user_id, new_email):
     cursor.execute("UPDATE users SET email = ? WHERE id = ?", (new_email, user_id))
 
 
+@group_commit
+def update_user_email_grouped(conn, user_id, new_email):
+    conn.execute("UPDATE users SET email = ? WHERE id = ?", (new_email, user_id))
+
+
+def _benchmark(update: Callable, threads: int = 16, updates: int = 4000) -> None:
+    from concurrent.futures import ThreadPoolExecutor
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(threads) as executor:
+        list(executor.map(lambda i: update(user_id=1 + i % 3, new_email=f"user{i}@example.com"),
+                          range(updates)))
+    elapsed = time.perf_counter() - start
+    print(f"{update.__name__:<26} {updates / elapsed:10.0f} updates/s")
+
+
 if __name__ == "__main__":
     # Create test database and table
     conn = sqlite3.connect('users.db')
@@ -109,4 +371,9 @@ if __name__ == "__main__":
     cursor = conn.cursor()
     cursor.execute("SELECT email FROM users WHERE id = ?", (1,))
     print(f"Updated email: {cursor.fetchone()[0]}")
-    conn.close()
\ No newline at end of file
+    conn.close()
+    
+    # Compare one commit per update with group commit
+    _benchmark(update_user_email)
+    _benchmark(update_user_email_grouped)
+    print(f"Group commit: {get_group_writer().stats()}")
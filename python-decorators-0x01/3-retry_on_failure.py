@@ -1,11 +1,18 @@
 #!/usr/bin/env python3
-"""Module that provides decorators for database operations with retry functionality"""
+"""Module that provides decorators for database operations with retry and circuit breaker functionality"""
 
 import time
+import random
 import sqlite3 
+import asyncio
+import inspect
 import functools
 import logging
-from typing import Callable, Any, Optional
+import threading
+from collections import deque
+from typing import Callable, Any, Deque, Dict, List, Optional, Tuple, Type, Union
+
+from connection_pool import get_async_pool, get_pool
 
 # Configure logging
 logging.basicConfig(
@@ -19,83 +26,434 @@ def with_db_connection(func: Callable) -> Callable:
     """Decorator that automatically handles opening and closing database connections.
     
     This decorator:
-    1. Opens a database connection
+    1. Checks a connection out of the process-wide pool for users.db
     2. Passes the connection as the first argument to the decorated function
-    3. Closes the connection after the function execution
+    3. Returns the connection to the pool after the function execution
     4. Allows the decorated function to be called without providing the connection
     
+    Coroutine functions get an aiosqlite connection from the running event
+    loop's pool instead (see AsyncSQLitePool) and are awaited.
+    
     Args:
         func: The function to decorate
         
     Returns:
         Callable: The decorated function
     """
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            async with get_async_pool('users.db').connection() as conn:
+                return await func(conn, *args, **kwargs)
+        
+        return async_wrapper
+    
     @functools.wraps(func)
     def wrapper(*args, **kwargs):
-        # Open a database connection
-        conn = sqlite3.connect('users.db')
-        
-        try:
+        # Check out a pooled connection; it goes back to the pool even if an
+        # exception occurs, with any uncommitted transaction rolled back
+        with get_pool('users.db').connection() as conn:
             # Pass the connection as the first argument
-            result = func(conn, *args, **kwargs)
-            return result
-        finally:
-            # Ensure the connection is closed even if an exception occurs
-            conn.close()
+            return func(conn, *args, **kwargs)
     
     return wrapper
 
 
-def retry_on_failure(retries: int = 3, delay: int = 2) -> Callable:
-    """Decorator that retries a function if it raises an exception.
+def is_transient(exc: BaseException) -> bool:
+    """Return True for errors that are worth retrying.
+
+    SQLite reports lock contention as an OperationalError whose message says
+    the database (or a table) is locked or busy; anything else, such as a
+    syntax error or a missing table, fails the same way on every attempt.
+    """
+    if not isinstance(exc, sqlite3.OperationalError):
+        return False
+    message = str(exc).lower()
+    return "locked" in message or "busy" in message
+
+
+class RetryBudget:
+    """Token bucket that keeps retries to a fraction of the calls made.
+
+    Every call deposits ratio tokens and every retry spends a whole token,
+    so in steady state at most ratio retries are made per call. The bucket
+    also refills at min_per_second so that rarely called functions can
+    still retry. When the bucket is empty, failures are raised immediately
+    instead of piling more load onto a struggling database.
+    """
+
+    def __init__(self, ratio: float = 0.2, min_per_second: float = 10.0, max_tokens: float = 100.0):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.max_tokens = max_tokens
+        self.tokens = max_tokens
+        self.retries = 0
+        self.exhausted = 0
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def deposit(self) -> None:
+        """Record a call."""
+        with self._lock:
+            self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def try_spend(self) -> bool:
+        """Take a token for a retry; return False if the budget is used up."""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.max_tokens, self.tokens + (now - self._updated) * self.min_per_second)
+            self._updated = now
+            if self.tokens < 1:
+                self.exhausted += 1
+                return False
+            self.tokens -= 1
+            self.retries += 1
+            return True
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            return {"tokens": self.tokens, "retries": self.retries, "exhausted": self.exhausted}
+
+
+# Shared by every retry_on_failure decorator that doesn't bring its own budget
+default_retry_budget = RetryBudget()
+
+
+def retry_on_failure(retries: int = 3, delay: float = 2, max_delay: float = 30.0,
+                     retry_on: Union[Callable[[BaseException], bool], Tuple[Type[BaseException], ...]] = is_transient,
+                     budget: Optional[RetryBudget] = default_retry_budget,
+                     deadline: Optional[float] = None) -> Callable:
+    """Decorator that retries a function if it raises a transient exception.
     
     This decorator:
     1. Executes the decorated function
-    2. If the function raises an exception, it waits for the specified delay
-    3. Retries the function up to the specified number of retries
-    4. If all retries fail, it raises the last exception
+    2. If the function raises an exception that retry_on accepts, it waits
+       for a random time between 0 and delay * 2 ** (attempt - 1) seconds,
+       capped at max_delay ("full jitter"), so that workers that failed
+       together don't retry in lockstep
+    3. Retries the function up to the specified number of retries, as long
+       as the retry budget has tokens left and the retry can still finish
+       before the deadline
+    4. If all retries fail, or a retry isn't allowed, it raises the last exception
+    
+    Coroutine functions are retried with asyncio.sleep, so waiting for the
+    next attempt doesn't block the event loop.
     
     Args:
         retries: Number of times to retry the function (default: 3)
-        delay: Number of seconds to wait between retries (default: 2)
+        delay: Base number of seconds for the backoff (default: 2)
+        max_delay: Longest wait between two attempts (default: 30)
+        retry_on: Predicate or tuple of exception types to retry
+            (default: is_transient, i.e. SQLite locked/busy errors)
+        budget: RetryBudget shared with other callers, or None for no budget
+        deadline: Seconds after the first attempt by which the call must
+            have finished; no retry is started that would sleep past it
         
     Returns:
         Callable: A decorator function
     """
+    if isinstance(retry_on, tuple):
+        exception_types = retry_on
+        retry_on = lambda exc: isinstance(exc, exception_types)  # noqa: E731
+
+    def backoff(func: Callable, attempt: int, error: Exception, started: float) -> Optional[float]:
+        # Return how long to sleep before the next attempt, or None to give up
+        if not retry_on(error):
+            return None
+        if attempt > retries:
+            logger.error(f"All {retries} retries failed for {func.__name__}: {str(error)}")
+            return None
+        pause = random.uniform(0, min(max_delay, delay * 2 ** (attempt - 1)))
+        if deadline is not None and time.monotonic() + pause - started >= deadline:
+            logger.error(f"Deadline of {deadline}s reached for {func.__name__}: {str(error)}")
+            return None
+        if budget is not None and not budget.try_spend():
+            logger.error(f"Retry budget exhausted, not retrying {func.__name__}: {str(error)}")
+            return None
+        logger.warning(
+            f"Attempt {attempt}/{retries} failed for {func.__name__}: {str(error)}"
+            f" - Retrying in {pause:.2f} seconds..."
+        )
+        return pause
+
     def decorator(func: Callable) -> Callable:
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs) -> Any:
+                started = time.monotonic()
+                if budget is not None:
+                    budget.deposit()
+                attempts = 0
+                while True:
+                    try:
+                        return await func(*args, **kwargs)
+                    except Exception as e:
+                        attempts += 1
+                        pause = backoff(func, attempts, e, started)
+                        if pause is None:
+                            raise
+                    await asyncio.sleep(pause)
+
+            return async_wrapper
+
         @functools.wraps(func)
         def wrapper(*args, **kwargs) -> Any:
+            started = time.monotonic()
+            if budget is not None:
+                budget.deposit()
             attempts = 0
-            last_exception: Optional[Exception] = None
-            
-            while attempts <= retries:
+            while True:
                 try:
                     # Attempt to execute the function
                     return func(*args, **kwargs)
                 except Exception as e:
                     attempts += 1
-                    last_exception = e
-                    
-                    if attempts <= retries:
-                        # Log the exception and retry
-                        logger.warning(
-                            f"Attempt {attempts}/{retries} failed for {func.__name__}: {str(e)}"
-                            f" - Retrying in {delay} seconds..."
-                        )
-                        # Wait before retrying
-                        time.sleep(delay)
-                    else:
-                        # Log the final failure
-                        logger.error(
-                            f"All {retries} retries failed for {func.__name__}: {str(e)}"
-                        )
+                    pause = backoff(func, attempts, e, started)
+                    if pause is None:
                         # Re-raise the last exception
-                        raise last_exception
+                        raise
+                # Wait before retrying
+                time.sleep(pause)
         
         return wrapper
     return decorator
 
 
+class CircuitOpenError(Exception):
+    """Raised instead of calling the function while a circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """Stops calling a failing database until it has had time to recover.
+
+    The breaker:
+    1. Starts closed and lets every call through, counting calls and
+       failures over the last window seconds
+    2. Opens once at least minimum_calls were made in the window and the
+       share of failures reaches failure_rate; while open, calls fail fast
+       with CircuitOpenError instead of waiting on the database
+    3. Turns half-open after reset_timeout seconds and lets up to
+       half_open_calls trial calls through
+    4. Closes again when all trial calls succeed, or reopens on the first
+       trial that fails
+
+    Only exceptions matching failure_on count as failures; others (a bad
+    argument, a constraint violation) say nothing about the database's
+    health and are passed through untouched. Every state change is
+    logged, counted in stats() and passed to the on_transition callbacks,
+    which run after the breaker's lock is released.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str = "database", failure_rate: float = 0.5, minimum_calls: int = 20,
+                 window: float = 10.0, reset_timeout: float = 30.0, half_open_calls: int = 1,
+                 failure_on: Tuple[Type[BaseException], ...] = (sqlite3.OperationalError,),
+                 on_transition: Optional[List[Callable[[str, str, str], None]]] = None):
+        self.name = name
+        self.failure_rate = failure_rate
+        self.minimum_calls = minimum_calls
+        self.window = window
+        self.reset_timeout = reset_timeout
+        self.half_open_calls = half_open_calls
+        self.failure_on = failure_on
+        self.on_transition = list(on_transition or [])
+        self._state = self.CLOSED
+        self._opened_at = 0.0
+        self._trials = 0
+        self._trial_successes = 0
+        # One [second, calls, failures] bucket per second of the window
+        self._buckets: Deque[List[int]] = deque()
+        self._lock = threading.Lock()
+        # Transitions made under the lock whose callbacks haven't run yet
+        self._unnotified: List[Tuple[str, str]] = []
+        self.rejected = 0
+        self.transitions: Dict[str, int] = {}
+
+    @property
+    def state(self) -> str:
+        try:
+            with self._lock:
+                return self._current_state(time.monotonic())
+        finally:
+            self._notify()
+
+    def before_call(self) -> None:
+        """Admit a call or raise CircuitOpenError."""
+        try:
+            with self._lock:
+                state = self._current_state(time.monotonic())
+                if state == self.OPEN or (state == self.HALF_OPEN and self._trials >= self.half_open_calls):
+                    self.rejected += 1
+                    raise CircuitOpenError(f"Circuit {self.name!r} is {state}; not calling the database")
+                if state == self.HALF_OPEN:
+                    self._trials += 1
+        finally:
+            self._notify()
+
+    def record_success(self) -> None:
+        try:
+            with self._lock:
+                now = time.monotonic()
+                if self._state == self.HALF_OPEN:
+                    self._trial_successes += 1
+                    if self._trial_successes >= self.half_open_calls:
+                        self._buckets.clear()
+                        self._transition(self.CLOSED, now)
+                    return
+                self._count(now, failed=False)
+        finally:
+            self._notify()
+
+    def record_failure(self) -> None:
+        try:
+            with self._lock:
+                now = time.monotonic()
+                if self._state == self.HALF_OPEN:
+                    self._transition(self.OPEN, now)
+                    return
+                calls, failures = self._count(now, failed=True)
+                if (self._state == self.CLOSED and calls >= self.minimum_calls
+                        and failures >= self.failure_rate * calls):
+                    self._transition(self.OPEN, now)
+        finally:
+            self._notify()
+
+    def stats(self) -> Dict[str, Any]:
+        try:
+            with self._lock:
+                now = time.monotonic()
+                calls, failures = self._window_totals(now)
+                return {
+                    "state": self._current_state(now),
+                    "calls": calls,
+                    "failures": failures,
+                    "rejected": self.rejected,
+                    "transitions": dict(self.transitions),
+                }
+        finally:
+            self._notify()
+
+    def __call__(self, func: Callable) -> Callable:
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs) -> Any:
+                self.before_call()
+                try:
+                    result = await func(*args, **kwargs)
+                except self.failure_on:
+                    self.record_failure()
+                    raise
+                except BaseException:
+                    self._release_trial()
+                    raise
+                self.record_success()
+                return result
+
+            async_wrapper.breaker = self
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs) -> Any:
+            self.before_call()
+            try:
+                result = func(*args, **kwargs)
+            except self.failure_on:
+                self.record_failure()
+                raise
+            except BaseException:
+                self._release_trial()
+                raise
+            self.record_success()
+            return result
+
+        wrapper.breaker = self
+        return wrapper
+
+    def _current_state(self, now: float) -> str:
+        # Called with the lock held
+        if self._state == self.OPEN and now - self._opened_at >= self.reset_timeout:
+            self._transition(self.HALF_OPEN, now)
+        return self._state
+
+    def _release_trial(self) -> None:
+        # A trial call that failed for an unrelated reason frees its slot
+        with self._lock:
+            if self._state == self.HALF_OPEN and self._trials > 0:
+                self._trials -= 1
+
+    def _transition(self, state: str, now: float) -> None:
+        # Called with the lock held
+        previous, self._state = self._state, state
+        if state == self.OPEN:
+            self._opened_at = now
+        self._trials = 0
+        self._trial_successes = 0
+        key = f"{previous}->{state}"
+        self.transitions[key] = self.transitions.get(key, 0) + 1
+        log = logger.info if state == self.CLOSED else logger.warning
+        log(f"Circuit {self.name!r} {previous} -> {state}")
+        self._unnotified.append((previous, state))
+
+    def _notify(self) -> None:
+        # Runs the on_transition callbacks outside the lock, so that they can
+        # read state or stats() without deadlocking
+        if not self._unnotified:
+            return
+        with self._lock:
+            transitions, self._unnotified = self._unnotified, []
+        for previous, state in transitions:
+            for callback in self.on_transition:
+                callback(self.name, previous, state)
+
+    def _count(self, now: float, failed: bool) -> Tuple[int, int]:
+        # Called with the lock held; returns the window totals including this call
+        second = int(now)
+        if not self._buckets or self._buckets[-1][0] != second:
+            self._buckets.append([second, 0, 0])
+        bucket = self._buckets[-1]
+        bucket[1] += 1
+        bucket[2] += failed
+        return self._window_totals(now)
+
+    def _window_totals(self, now: float) -> Tuple[int, int]:
+        # Called with the lock held
+        oldest = int(now - self.window)
+        while self._buckets and self._buckets[0][0] <= oldest:
+            self._buckets.popleft()
+        return sum(b[1] for b in self._buckets), sum(b[2] for b in self._buckets)
+
+
+def circuit_breaker(**breaker_kwargs: Any) -> Callable:
+    """Decorator that guards a function with its own CircuitBreaker.
+    
+    Put it outside with_db_connection and retry_on_failure so that an open
+    circuit fails fast before a connection is checked out or any retry
+    sleeps, and so that one call counts once however often it was retried:
+    
+        @circuit_breaker(failure_rate=0.5, reset_timeout=10)
+        @with_db_connection
+        @retry_on_failure(retries=2, delay=0.1)
+        def fetch_users(conn): ...
+    
+    The breaker is available as fetch_users.breaker, e.g. for its stats().
+    To share one breaker between several functions, create a CircuitBreaker
+    and use the instance itself as the decorator.
+    
+    Args:
+        **breaker_kwargs: Arguments for CircuitBreaker
+        
+    Returns:
+        Callable: A decorator function
+    """
+    def decorator(func: Callable) -> Callable:
+        breaker_kwargs.setdefault("name", func.__name__)
+        return CircuitBreaker(**breaker_kwargs)(func)
+    return decorator
+
+
 @with_db_connection
 @retry_on_failure(retries=3, delay=1)
 def fetch_users_with_retry(conn):
@@ -161,4 +519,16 @@ if __name__ == "__main__":
     print("\n2. Fetch with simulated transient errors:")
     print("   (This should retry and succeed after 2 failures)")
     users = simulate_transient_failure()
-    print(f"   Success on 3rd attempt: {users}")
\ No newline at end of file
+    print(f"   Success on 3rd attempt: {users}")
+
+    print("\n3. Circuit breaker during a simulated outage:")
+    @circuit_breaker(minimum_calls=5, reset_timeout=0.5)
+    def outage():
+        raise sqlite3.OperationalError("unable to open database file")
+
+    for _ in range(8):
+        try:
+            outage()
+        except (sqlite3.OperationalError, CircuitOpenError) as e:
+            print(f"   {type(e).__name__}: {e}")
+    print(f"   {outage.breaker.stats()}")
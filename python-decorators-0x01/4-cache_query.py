@@ -2,10 +2,16 @@
 """Module that provides a query caching decorator for database operations"""
 
 import time
+import asyncio
 import sqlite3 
+import inspect
 import functools
 import logging
-from typing import Callable, Any, Dict, Tuple, List
+from typing import Callable, Any, Optional, Tuple
+
+from connection_pool import close_async_pools, get_async_pool, get_pool
+from cache_backends import CacheBackend, backend_from_env
+from db_cache import QueryCache, adatabase_identity, database_identity, tables_read
 
 # Configure logging
 logging.basicConfig(
@@ -14,91 +20,155 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Global cache to store query results
-query_cache: Dict[str, Tuple[List[Tuple], float]] = {}
+# Global cache to store query results: bounded, invalidated by writes, and
+# shared between worker processes when QUERY_CACHE_BACKEND says so
+query_cache = QueryCache(max_entries=1024, stale_ttl=30.0, backend=backend_from_env())
 
 
 def with_db_connection(func: Callable) -> Callable:
     """Decorator that automatically handles opening and closing database connections.
     
     This decorator:
-    1. Opens a database connection
+    1. Checks a connection out of the process-wide pool for users.db
     2. Passes the connection as the first argument to the decorated function
-    3. Closes the connection after the function execution
+    3. Returns the connection to the pool after the function execution
     4. Allows the decorated function to be called without providing the connection
     
+    Coroutine functions get an aiosqlite connection from the running event
+    loop's pool instead (see AsyncSQLitePool) and are awaited.
+    
     Args:
         func: The function to decorate
         
     Returns:
         Callable: The decorated function
     """
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            async with get_async_pool('users.db').connection() as conn:
+                return await func(conn, *args, **kwargs)
+        
+        return async_wrapper
+    
     @functools.wraps(func)
     def wrapper(*args, **kwargs):
-        # Open a database connection
-        conn = sqlite3.connect('users.db')
-        
-        try:
+        # Check out a pooled connection; it goes back to the pool even if an
+        # exception occurs, with any uncommitted transaction rolled back
+        with get_pool('users.db').connection() as conn:
             # Pass the connection as the first argument
-            result = func(conn, *args, **kwargs)
-            return result
-        finally:
-            # Ensure the connection is closed even if an exception occurs
-            conn.close()
+            return func(conn, *args, **kwargs)
     
     return wrapper
 
 
-def cache_query(func: Callable) -> Callable:
+def _query_and_params(args: tuple, kwargs: dict) -> Tuple[Optional[str], Any]:
+    # Extract the query and its parameters from arguments
+    query = kwargs.get('query')
+    params = kwargs.get('params', ())
+    if query is None and args and isinstance(args[0], str):
+        query = args[0]
+        if len(args) > 1 and 'params' not in kwargs:
+            params = args[1]
+    return query, params
+
+
+def cache_query(func: Optional[Callable] = None, *, cache: Optional[QueryCache] = None,
+                ttl: Optional[float] = None, backend: Optional[CacheBackend] = None) -> Callable:
     """Decorator that caches query results to avoid redundant database calls.
     
     This decorator:
-    1. Uses the SQL query string as a cache key
+    1. Builds a cache key from the database, the SQL query and its parameters
     2. Checks if the query result is already in the cache
     3. If in cache, returns the cached result without executing the query
     4. If not in cache, executes the query and stores the result in the cache
     
+    Concurrent callers missing the same query wait for a single execution.
+    If the cache has a stale_ttl, expired results are served while one
+    background refresh, on its own connection, replaces them.
+    
+    Results are dropped when the cache is full (least recently used first),
+    when their ttl expires, or when a write made through the transactional
+    decorator touches one of the tables they were read from.
+    
+    Can be used bare (@cache_query) or configured (@cache_query(ttl=60)).
+    Coroutine functions are cached with QueryCache.aget_or_load, so tasks
+    on one event loop missing the same query await a single execution.
+    
     Args:
         func: The function to decorate
+        cache: The QueryCache to use (default: the module-level query_cache)
+        ttl: Seconds before a cached result expires (default: the cache's ttl)
+        backend: Storage for a dedicated QueryCache, e.g. SharedMemoryBackend()
+            or SQLiteBackend() from cache_backends (ignored if cache is given)
         
     Returns:
         Callable: The decorated function
     """
-    @functools.wraps(func)
-    def wrapper(conn, *args, **kwargs):
-        # Extract the query from arguments
-        query = kwargs.get('query')
-        if not query:
-            if args and isinstance(args[0], str):
-                query = args[0]
-            else:
+    if cache is None and backend is not None:
+        cache = QueryCache(stale_ttl=30.0, backend=backend)
+
+    def decorator(func: Callable) -> Callable:
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(conn, *args, **kwargs):
+                store = cache if cache is not None else query_cache
+                query, params = _query_and_params(args, kwargs)
+                if not query:
+                    logger.warning("No query provided for caching")
+                    return await func(conn, *args, **kwargs)
+                
+                database = await adatabase_identity(conn)
+                cache_key = store.make_key(database, query, params)
+                
+                async def load():
+                    return await func(conn, *args, **kwargs)
+                
+                refresh = None
+                if not database.startswith(":memory:"):
+                    async def refresh():
+                        async with get_async_pool(database).connection() as refresh_conn:
+                            return await func(refresh_conn, *args, **kwargs)
+                
+                return await store.aget_or_load(cache_key, load, database, tables_read(query),
+                                                ttl=ttl, refresh=refresh)
+            
+            return async_wrapper
+        
+        @functools.wraps(func)
+        def wrapper(conn, *args, **kwargs):
+            store = cache if cache is not None else query_cache
+            query, params = _query_and_params(args, kwargs)
+            if not query:
                 # If no query is provided, just execute the function without caching
                 logger.warning("No query provided for caching")
                 return func(conn, *args, **kwargs)
+            
+            database = database_identity(conn)
+            cache_key = store.make_key(database, query, params)
+            
+            def load():
+                # Only the first of concurrent callers missing this key gets here
+                logger.debug(f"Cache miss for query: {query[:50]}...")
+                start_time = time.time()
+                result = func(conn, *args, **kwargs)
+                logger.debug(f"Query executed in {time.time() - start_time:.4f}s and cached")
+                return result
+            
+            refresh = None
+            if not database.startswith(":memory:"):
+                def refresh():
+                    # Background refreshes outlive the caller's connection
+                    with get_pool(database).connection() as refresh_conn:
+                        return func(refresh_conn, *args, **kwargs)
+            
+            return store.get_or_load(cache_key, load, database, tables_read(query), ttl=ttl, refresh=refresh)
         
-        # Use the query string as the cache key
-        cache_key = query
-        
-        # Check if the query result is in the cache
-        if cache_key in query_cache:
-            cached_result, timestamp = query_cache[cache_key]
-            cache_age = time.time() - timestamp
-            logger.info(f"Cache hit for query: {query[:50]}... (Age: {cache_age:.2f}s)")
-            return cached_result
-        
-        # If not in cache, execute the query
-        logger.info(f"Cache miss for query: {query[:50]}...")
-        start_time = time.time()
-        result = func(conn, *args, **kwargs)
-        execution_time = time.time() - start_time
-        
-        # Store the result in the cache with a timestamp
-        query_cache[cache_key] = (result, time.time())
-        
-        logger.info(f"Query executed in {execution_time:.4f}s and cached")
-        return result
-    
-    return wrapper
+        return wrapper
+
+    if func is not None:
+        return decorator(func)
+    return decorator
 
 
 @with_db_connection
@@ -109,6 +179,13 @@ def fetch_users_with_cache(conn, query):
     return cursor.fetchall()
 
 
+@with_db_connection
+@cache_query
+async def afetch_users_with_cache(conn, query):
+    async with conn.execute(query) as cursor:
+        return await cursor.fetchall()
+
+
 if __name__ == "__main__":
     # Create test database and table
     conn = sqlite3.connect('users.db')
@@ -156,4 +233,19 @@ if __name__ == "__main__":
     start_time = time.time()
     filtered_users = fetch_users_with_cache(query="SELECT * FROM users WHERE id = 1")
     print(f"   Result: {filtered_users}")
-    print(f"   Execution time: {time.time() - start_time:.6f} seconds")
\ No newline at end of file
+    print(f"   Execution time: {time.time() - start_time:.6f} seconds")
+    
+    print(f"\n4. Cache statistics: {query_cache.stats()}")
+    
+    print("\n5. Concurrent tasks missing the same query await a single execution:")
+    query_cache.clear()
+    
+    async def fetch_concurrently(tasks: int = 50):
+        start_time = time.time()
+        results = await asyncio.gather(*(afetch_users_with_cache(query="SELECT * FROM users")
+                                         for _ in range(tasks)))
+        print(f"   {len(results)} tasks, {time.time() - start_time:.6f} seconds")
+        await close_async_pools()
+    
+    asyncio.run(fetch_concurrently())
+    print(f"   Cache statistics: {query_cache.stats()}")
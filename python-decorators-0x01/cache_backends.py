@@ -0,0 +1,589 @@
+#!/usr/bin/env python3
+"""Module that provides the storage backends behind db_cache.QueryCache"""
+
+import os
+import sys
+import mmap
+import time
+import struct
+import marshal
+import sqlite3
+import hashlib
+import tempfile
+import threading
+import functools
+import weakref
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, Hashable, Iterable, Iterator, Optional, Set, Tuple
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows; SharedMemoryBackend needs it
+    fcntl = None
+
+class CacheEntry:
+    """A cached query result together with its expiry times and table dependencies.
+
+    Times are wall-clock (time.time()) so that entries can be shared between
+    processes. dependencies maps each table the result was read from to the
+    generation of that table when the query ran.
+    """
+    __slots__ = ("value", "size", "expires_at", "stale_until", "database", "dependencies")
+
+    def __init__(self, value: Any, expires_at: Optional[float], stale_until: Optional[float],
+                 database: str, dependencies: Dict[str, int], size: int = 0):
+        self.value = value
+        self.size = size
+        self.expires_at = expires_at
+        self.stale_until = stale_until
+        self.database = database
+        self.dependencies = dependencies
+
+
+# -- Serialization -----------------------------------------------------------
+#
+# Query results are lists of tuples of None/int/float/str/bytes, which marshal
+# encodes and decodes several times faster than pickle. Values marshal
+# rejects are not cached by shared backends: their data comes from files or
+# servers other processes can write to, and unpickling it could run
+# arbitrary code. The first byte of an encoded value tags the encoding;
+# marshal data also records the marshal version that wrote it.
+
+_MARSHAL = b"M"
+
+
+def encode_value(value: Any) -> bytes:
+    """Serialize a query result for a shared backend; raises ValueError if marshal can't."""
+    return _MARSHAL + bytes((marshal.version,)) + marshal.dumps(value)
+
+
+def decode_value(data: bytes) -> Any:
+    """Inverse of encode_value()."""
+    tag = data[:1]
+    if tag != _MARSHAL:
+        raise ValueError(f"unknown cache encoding {tag!r}")
+    if data[1] != marshal.version:
+        raise ValueError(f"cached value was written with marshal version {data[1]}")
+    return marshal.loads(data[2:])
+
+
+def encode_entry(entry: CacheEntry) -> bytes:
+    return marshal.dumps((entry.expires_at, entry.stale_until, entry.database,
+                          tuple(entry.dependencies.items()), encode_value(entry.value)))
+
+
+def decode_entry(data: bytes) -> CacheEntry:
+    expires_at, stale_until, database, dependencies, value = marshal.loads(data)
+    return CacheEntry(decode_value(value), expires_at, stale_until, database, dict(dependencies),
+                      size=len(data))
+
+
+# Errors decoding a stored entry that was torn or written by another version
+_DECODE_ERRORS = (ValueError, TypeError, EOFError, IndexError)
+
+
+def _canonical(value: Any) -> str:
+    # A text form that is the same for equal keys in every process. marshal
+    # and pickle output isn't: both write back-references to repeated
+    # objects, and set order depends on the per-process string hash seed.
+    if isinstance(value, (tuple, list)):
+        return f"{type(value).__name__}({','.join(map(_canonical, value))})"
+    if isinstance(value, (set, frozenset)):
+        return f"{type(value).__name__}({','.join(sorted(map(_canonical, value)))})"
+    if isinstance(value, dict):
+        items = sorted(f"{_canonical(k)}:{_canonical(v)}" for k, v in value.items())
+        return f"dict({','.join(items)})"
+    return f"{type(value).__name__}:{value!r}"
+
+
+def key_digest(key: Hashable) -> bytes:
+    """Stable 16-byte digest of a cache key, identical in every process."""
+    return hashlib.blake2b(_canonical(key).encode("utf-8", "surrogatepass"), digest_size=16).digest()
+
+
+# -- Backends ----------------------------------------------------------------
+
+class CacheBackend:
+    """Storage interface used by QueryCache.
+
+    Backends store CacheEntry objects by key and keep one generation counter
+    per (database, table). They decide themselves what to evict when full;
+    expiry and invalidation checks are done by QueryCache. All methods must
+    be thread-safe.
+    """
+
+    evictions = 0
+
+    def load(self, key: Hashable) -> Optional[CacheEntry]:
+        raise NotImplementedError
+
+    def store(self, key: Hashable, entry: CacheEntry) -> None:
+        raise NotImplementedError
+
+    def delete(self, key: Hashable) -> None:
+        raise NotImplementedError
+
+    def touch(self, key: Hashable) -> None:
+        """Record a hit, for backends that evict least recently used entries."""
+
+    def generations(self, database: str, tables: Optional[Iterable[str]] = None) -> Any:
+        """Return a snapshot of the database's table generations supporting .get(table, 0).
+
+        When tables is given only those need to be in the snapshot, which
+        lets backends skip reading the others.
+        """
+        raise NotImplementedError
+
+    def bump(self, database: str, tables: Iterable[str]) -> int:
+        """Increment the generations of tables; return how many entries were dropped eagerly."""
+        raise NotImplementedError
+
+    def clear(self) -> None:
+        raise NotImplementedError
+
+    def stats(self) -> Dict[str, Any]:
+        return {"entries": len(self), "evictions": self.evictions}
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+
+class InProcessBackend(CacheBackend):
+    """Backend keeping live objects in a dict, evicting least recently used first.
+
+    Entries are bounded by max_entries and, optionally, by max_bytes of
+    estimated result size. Values are not serialized, so hits return the
+    cached object itself.
+    """
+
+    def __init__(self, max_entries: int = 1024, max_bytes: Optional[int] = None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.evictions = 0
+        self._entries: "OrderedDict[Hashable, CacheEntry]" = OrderedDict()
+        self._by_table: Dict[Tuple[str, str], Set[Hashable]] = {}
+        self._generations: Dict[Tuple[str, str], int] = {}
+        self._bytes = 0
+        self._lock = threading.RLock()
+
+    def load(self, key: Hashable) -> Optional[CacheEntry]:
+        return self._entries.get(key)
+
+    def store(self, key: Hashable, entry: CacheEntry) -> None:
+        entry.size = estimate_size(entry.value)
+        if self.max_bytes is not None and entry.size > self.max_bytes:
+            return
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = entry
+            self._bytes += entry.size
+            for table in entry.dependencies:
+                self._by_table.setdefault((entry.database, table), set()).add(key)
+
+            while self._entries and (len(self._entries) > self.max_entries or
+                                     (self.max_bytes is not None and self._bytes > self.max_bytes)):
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def delete(self, key: Hashable) -> None:
+        with self._lock:
+            self._remove(key)
+
+    def touch(self, key: Hashable) -> None:
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+
+    def generations(self, database: str, tables: Optional[Iterable[str]] = None) -> Dict[str, int]:
+        with self._lock:
+            if tables is not None:
+                return {table: self._generations.get((database, table), 0) for table in tables}
+            return {table: gen for (db, table), gen in self._generations.items() if db == database}
+
+    def bump(self, database: str, tables: Iterable[str]) -> int:
+        with self._lock:
+            dropped = 0
+            for table in tables:
+                self._generations[(database, table)] = self._generations.get((database, table), 0) + 1
+                for key in list(self._by_table.get((database, table), ())):
+                    self._remove(key)
+                    dropped += 1
+            return dropped
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._by_table.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {"entries": len(self._entries), "evictions": self.evictions, "bytes": self._bytes}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _remove(self, key: Hashable) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self._bytes -= entry.size
+        for table in entry.dependencies:
+            keys = self._by_table.get((entry.database, table))
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_table[(entry.database, table)]
+
+
+_COUNTER = struct.Struct("Q")
+
+
+class _HashedGenerations:
+    """Generation snapshot of a SharedMemoryBackend, looked up by table name."""
+    __slots__ = ("_backend", "_database", "_counters")
+
+    def __init__(self, backend: "SharedMemoryBackend", database: str, counters: Tuple[int, ...]):
+        self._backend = backend
+        self._database = database
+        self._counters = counters
+
+    def get(self, table: str, default: int = 0) -> int:
+        return self._counters[self._backend._generation_index(self._database, table)]
+
+
+class SharedMemoryBackend(CacheBackend):
+    """Backend storing entries in a memory-mapped file shared by every process.
+
+    The file (by default in /dev/shm) holds a fixed table of slots slots of
+    slot_size bytes, so it never grows. A key may live in any of `ways`
+    consecutive slots; when they are all taken the oldest is overwritten.
+    Results larger than a slot are not cached. Table generations are
+    counters hashed into generation_slots buckets: a hash collision only
+    causes an unnecessary invalidation. Access is serialized with flock.
+
+    A forked child reopens the file, since flock gives no exclusion between
+    processes sharing the parent's open file description.
+    """
+
+    _MAGIC = b"QCSHM001"
+    _HEADER = struct.Struct("8sIII")
+    _SLOT = struct.Struct("16sdI")
+    _HEADER_SIZE = 64
+
+    def __init__(self, name: str = "query_cache", slots: int = 4096, slot_size: int = 16384,
+                 generation_slots: int = 4096, ways: int = 4, path: Optional[str] = None):
+        if fcntl is None:
+            raise RuntimeError("SharedMemoryBackend requires fcntl (POSIX)")
+        if path is None:
+            directory = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+            path = os.path.join(directory, name)
+        self.path = path
+        self.slots = slots
+        self.slot_size = slot_size
+        self.generation_slots = generation_slots
+        self.ways = min(ways, slots)
+        self.evictions = 0
+        self._slots_offset = self._HEADER_SIZE + 8 * generation_slots
+        self._size = self._slots_offset + slots * slot_size
+        self._thread_lock = threading.Lock()
+
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        self._pid = os.getpid()
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            if os.fstat(self._fd).st_size == 0:
+                os.ftruncate(self._fd, self._size)
+                os.pwrite(self._fd, self._HEADER.pack(self._MAGIC, slots, slot_size, generation_slots), 0)
+            header = self._HEADER.unpack(os.pread(self._fd, self._HEADER.size, 0))
+            if header != (self._MAGIC, slots, slot_size, generation_slots):
+                raise ValueError(f"{path} holds a cache with a different layout: {header}")
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        self._map = mmap.mmap(self._fd, self._size)
+        backend = weakref.ref(self)
+        os.register_at_fork(after_in_child=lambda: backend() is not None and backend()._reopen())
+
+    def _reopen(self) -> None:
+        # Runs in a forked child before it has other threads
+        if self._pid == os.getpid() or self._fd < 0:
+            return
+        self._map.close()
+        os.close(self._fd)
+        self._thread_lock = threading.Lock()
+        self._fd = os.open(self.path, os.O_RDWR)
+        self._map = mmap.mmap(self._fd, self._size)
+        self._pid = os.getpid()
+
+    @contextmanager
+    def _locked(self, exclusive: bool) -> Iterator[None]:
+        with self._thread_lock:
+            fcntl.flock(self._fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def _candidates(self, digest: bytes) -> Iterator[int]:
+        first = int.from_bytes(digest[:8], "little") % self.slots
+        for way in range(self.ways):
+            yield self._slots_offset + ((first + way) % self.slots) * self.slot_size
+
+    def _find(self, digest: bytes) -> Optional[int]:
+        for offset in self._candidates(digest):
+            if self._map[offset:offset + 16] == digest:
+                return offset
+        return None
+
+    def load(self, key: Hashable) -> Optional[CacheEntry]:
+        digest = key_digest(key)
+        with self._locked(exclusive=False):
+            offset = self._find(digest)
+            if offset is None:
+                return None
+            _, _, length = self._SLOT.unpack_from(self._map, offset)
+            start = offset + self._SLOT.size
+            data = self._map[start:start + length]
+        try:
+            return decode_entry(data)
+        except _DECODE_ERRORS:
+            self.delete(key)
+            return None
+
+    def store(self, key: Hashable, entry: CacheEntry) -> None:
+        digest = key_digest(key)
+        data = encode_entry(entry)
+        if self._SLOT.size + len(data) > self.slot_size:
+            return
+        with self._locked(exclusive=True):
+            offset = self._find(digest)
+            if offset is None:
+                oldest_at = None
+                for candidate in self._candidates(digest):
+                    _, stored_at, length = self._SLOT.unpack_from(self._map, candidate)
+                    if length == 0:
+                        offset = candidate
+                        break
+                    if oldest_at is None or stored_at < oldest_at:
+                        offset, oldest_at = candidate, stored_at
+                else:
+                    self.evictions += 1
+            self._SLOT.pack_into(self._map, offset, digest, time.time(), len(data))
+            start = offset + self._SLOT.size
+            self._map[start:start + len(data)] = data
+
+    def delete(self, key: Hashable) -> None:
+        digest = key_digest(key)
+        with self._locked(exclusive=True):
+            offset = self._find(digest)
+            if offset is not None:
+                self._SLOT.pack_into(self._map, offset, bytes(16), 0.0, 0)
+
+    def _generation_index(self, database: str, table: str) -> int:
+        return _bucket(database, table, self.generation_slots)
+
+    def generations(self, database: str, tables: Optional[Iterable[str]] = None) -> Any:
+        if tables is not None:
+            # Read just the counters asked for rather than all generation_slots
+            offsets = {table: self._HEADER_SIZE + 8 * self._generation_index(database, table)
+                       for table in tables}
+            with self._locked(exclusive=False):
+                return {table: _COUNTER.unpack_from(self._map, offset)[0] for table, offset in offsets.items()}
+        with self._locked(exclusive=False):
+            counters = struct.unpack_from(f"{self.generation_slots}Q", self._map, self._HEADER_SIZE)
+        return _HashedGenerations(self, database, counters)
+
+    def bump(self, database: str, tables: Iterable[str]) -> int:
+        with self._locked(exclusive=True):
+            for table in tables:
+                offset = self._HEADER_SIZE + 8 * self._generation_index(database, table)
+                (gen,) = _COUNTER.unpack_from(self._map, offset)
+                _COUNTER.pack_into(self._map, offset, gen + 1)
+        return 0
+
+    def clear(self) -> None:
+        # Generations are kept: they must never go backwards.
+        with self._locked(exclusive=True):
+            for index in range(self.slots):
+                self._SLOT.pack_into(self._map, self._slots_offset + index * self.slot_size, bytes(16), 0.0, 0)
+
+    def __len__(self) -> int:
+        with self._locked(exclusive=False):
+            return sum(1 for index in range(self.slots)
+                       if self._SLOT.unpack_from(self._map, self._slots_offset + index * self.slot_size)[2])
+
+    def close(self) -> None:
+        self._map.close()
+        os.close(self._fd)
+        self._fd = -1
+
+
+@functools.lru_cache(maxsize=4096)
+def _bucket(database: str, table: str, buckets: int) -> int:
+    # hash() is randomized per process, so use a digest every process agrees on.
+    digest = hashlib.blake2b(f"{database}\0{table}".encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "little") % buckets
+
+
+class SQLiteBackend(CacheBackend):
+    """Backend persisting entries in a SQLite file, shared by every process using it.
+
+    Survives restarts. Once more than max_entries are stored, the oldest
+    ones are deleted (checked every prune_interval stores).
+    """
+
+    def __init__(self, path: str = "query_cache.db", max_entries: int = 100000, prune_interval: int = 256):
+        self.path = path
+        self.max_entries = max_entries
+        self.prune_interval = prune_interval
+        self.evictions = 0
+        self._stores = 0
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("CREATE TABLE IF NOT EXISTS entries "
+                     "(key BLOB PRIMARY KEY, record BLOB NOT NULL, stored_at REAL NOT NULL)")
+        conn.execute("CREATE INDEX IF NOT EXISTS entries_stored_at ON entries (stored_at)")
+        conn.execute("CREATE TABLE IF NOT EXISTS generations "
+                     "(db TEXT NOT NULL, tbl TEXT NOT NULL, gen INTEGER NOT NULL, PRIMARY KEY (db, tbl))")
+
+    def _conn(self) -> sqlite3.Connection:
+        # One connection per thread, in autocommit mode.
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, isolation_level=None, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def load(self, key: Hashable) -> Optional[CacheEntry]:
+        row = self._conn().execute("SELECT record FROM entries WHERE key = ?", (key_digest(key),)).fetchone()
+        if row is None:
+            return None
+        try:
+            return decode_entry(row[0])
+        except _DECODE_ERRORS:
+            self.delete(key)
+            return None
+
+    def store(self, key: Hashable, entry: CacheEntry) -> None:
+        conn = self._conn()
+        conn.execute("INSERT OR REPLACE INTO entries (key, record, stored_at) VALUES (?, ?, ?)",
+                     (key_digest(key), encode_entry(entry), time.time()))
+        self._stores += 1
+        if self._stores % self.prune_interval == 0:
+            cursor = conn.execute(
+                "DELETE FROM entries WHERE key IN (SELECT key FROM entries ORDER BY stored_at "
+                "LIMIT MAX((SELECT COUNT(*) FROM entries) - ?, 0))", (self.max_entries,))
+            self.evictions += cursor.rowcount
+
+    def delete(self, key: Hashable) -> None:
+        self._conn().execute("DELETE FROM entries WHERE key = ?", (key_digest(key),))
+
+    def generations(self, database: str, tables: Optional[Iterable[str]] = None) -> Dict[str, int]:
+        return dict(self._conn().execute("SELECT tbl, gen FROM generations WHERE db = ?", (database,)))
+
+    def bump(self, database: str, tables: Iterable[str]) -> int:
+        conn = self._conn()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany("INSERT INTO generations (db, tbl, gen) VALUES (?, ?, 1) "
+                             "ON CONFLICT (db, tbl) DO UPDATE SET gen = gen + 1",
+                             [(database, table) for table in tables])
+        return 0
+
+    def clear(self) -> None:
+        self._conn().execute("DELETE FROM entries")
+
+    def __len__(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+
+class RedisBackend(CacheBackend):
+    """Backend storing entries in Redis (requires the redis package).
+
+    Entries get a Redis expiry at the end of their stale window so that
+    Redis reclaims them; table generations are kept in one hash per database.
+    """
+
+    def __init__(self, client: Any = None, url: str = "redis://localhost:6379/0", prefix: str = "query_cache:"):
+        if client is None:
+            import redis
+            client = redis.Redis.from_url(url)
+        self.client = client
+        self.prefix = prefix
+
+    def _key(self, key: Hashable) -> str:
+        return self.prefix + key_digest(key).hex()
+
+    def load(self, key: Hashable) -> Optional[CacheEntry]:
+        data = self.client.get(self._key(key))
+        if data is None:
+            return None
+        try:
+            return decode_entry(data)
+        except _DECODE_ERRORS:
+            self.delete(key)
+            return None
+
+    def store(self, key: Hashable, entry: CacheEntry) -> None:
+        until = entry.stale_until if entry.stale_until is not None else entry.expires_at
+        ttl_ms = None if until is None else max(int((until - time.time()) * 1000), 1)
+        self.client.set(self._key(key), encode_entry(entry), px=ttl_ms)
+
+    def delete(self, key: Hashable) -> None:
+        self.client.delete(self._key(key))
+
+    def generations(self, database: str, tables: Optional[Iterable[str]] = None) -> Dict[str, int]:
+        name = f"{self.prefix}generations:{database}"
+        if tables is not None:
+            tables = list(tables)
+            return {table: int(gen or 0) for table, gen in zip(tables, self.client.hmget(name, tables))}
+        counters = self.client.hgetall(name)
+        return {table.decode(): int(gen) for table, gen in counters.items()}
+
+    def bump(self, database: str, tables: Iterable[str]) -> int:
+        pipeline = self.client.pipeline()
+        for table in tables:
+            pipeline.hincrby(f"{self.prefix}generations:{database}", table, 1)
+        pipeline.execute()
+        return 0
+
+    def clear(self) -> None:
+        for name in self.client.scan_iter(match=self.prefix + "*"):
+            if b":generations:" not in name:
+                self.client.delete(name)
+
+    def __len__(self) -> int:
+        return sum(1 for name in self.client.scan_iter(match=self.prefix + "*")
+                   if b":generations:" not in name)
+
+
+def backend_from_env() -> CacheBackend:
+    """Build the backend named by QUERY_CACHE_BACKEND: memory (default), shm, sqlite or redis.
+
+    QUERY_CACHE_PATH sets the shared-memory file or SQLite database and
+    QUERY_CACHE_URL the Redis URL.
+    """
+    kind = os.environ.get("QUERY_CACHE_BACKEND", "memory")
+    path = os.environ.get("QUERY_CACHE_PATH")
+    if kind == "memory":
+        return InProcessBackend()
+    if kind == "shm":
+        return SharedMemoryBackend(path=path)
+    if kind == "sqlite":
+        return SQLiteBackend(path or "query_cache.db")
+    if kind == "redis":
+        return RedisBackend(url=os.environ.get("QUERY_CACHE_URL", "redis://localhost:6379/0"))
+    raise ValueError(f"Unknown QUERY_CACHE_BACKEND: {kind!r}")
+
+
+def estimate_size(value: Any) -> int:
+    """Approximate memory footprint of a query result (rows of scalars)."""
+    size = sys.getsizeof(value)
+    if isinstance(value, (list, tuple)):
+        for row in value:
+            size += sys.getsizeof(row)
+            if isinstance(row, (list, tuple)):
+                size += sum(sys.getsizeof(item) for item in row)
+    return size
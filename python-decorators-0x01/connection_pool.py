@@ -0,0 +1,466 @@
+#!/usr/bin/env python3
+"""Module that provides process-wide pools of reusable SQLite connections, sync and async"""
+
+import os
+import time
+import asyncio
+import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+
+try:
+    import aiosqlite
+except ImportError:  # only needed by AsyncSQLitePool
+    aiosqlite = None
+
+# Applied to every new connection; override per pool with pragmas=...
+DEFAULT_PRAGMAS: Dict[str, Any] = {
+    "journal_mode": "WAL",       # readers don't block the writer and vice versa
+    "synchronous": "NORMAL",     # safe with WAL, avoids an fsync per commit
+    "cache_size": -16000,        # 16 MiB page cache per connection
+    "mmap_size": 268435456,      # read pages through a 256 MiB memory map
+    "busy_timeout": 5000,        # wait up to 5s on locks instead of failing
+}
+
+
+class PoolTimeout(Exception):
+    """Raised when no pooled connection becomes available in time."""
+
+
+class StatementStats:
+    """Counts statement compilations and reuses on one connection.
+
+    sqlite3 keeps the last cached_statements prepared statements of a
+    connection in an LRU cache keyed by SQL text. This mirrors that cache
+    to tell whether an execute() compiled its SQL or reused a statement.
+    """
+    __slots__ = ("size", "compiled", "reused", "_recent")
+
+    def __init__(self, size: int):
+        self.size = size
+        self.compiled = 0
+        self.reused = 0
+        self._recent: "OrderedDict[str, None]" = OrderedDict()
+
+    def record(self, sql: str) -> None:
+        if sql in self._recent:
+            self._recent.move_to_end(sql)
+            self.reused += 1
+            return
+        self.compiled += 1
+        self._recent[sql] = None
+        if len(self._recent) > self.size:
+            self._recent.popitem(last=False)
+
+
+class StatsCursor(sqlite3.Cursor):
+    """Cursor that reports the SQL it executes to its connection's StatementStats."""
+
+    def execute(self, sql, parameters=()):
+        self.connection.statements.record(sql)
+        return super().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        self.connection.statements.record(sql)
+        return super().executemany(sql, seq_of_parameters)
+
+
+class PooledConnection(sqlite3.Connection):
+    """sqlite3.Connection that remembers its database path and counts statement reuse."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.database: Optional[str] = None
+        self.last_used = time.monotonic()
+        self.owner_thread: Optional[int] = None
+        self.statements = StatementStats(kwargs.get("cached_statements", 128))
+
+    def cursor(self, factory=StatsCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+class SQLitePool:
+    """Thread-safe pool of SQLite connections to one database file.
+
+    This pool:
+    1. Opens connections lazily, up to max_size, applying pragmas to each
+    2. Hands an idle connection last used by the calling thread back to that
+       thread first, so its page cache and prepared statements stay warm
+    3. Waits up to timeout seconds for a connection when all are in use
+    4. Runs a health check (SELECT 1) on connections idle for longer than
+       health_check_after seconds, replacing broken ones
+    5. Rolls back any transaction left open when a connection is returned
+    6. Keeps up to statement_cache_size prepared statements per connection
+       (sqlite3's cached_statements) and counts how often SQL had to be
+       compiled versus reused from that cache
+
+    Connections are opened with check_same_thread=False so that they can
+    move between threads, but a connection is only ever used by the thread
+    that checked it out.
+    """
+
+    def __init__(self, database: str, max_size: int = 8, timeout: float = 5.0,
+                 pragmas: Optional[Dict[str, Any]] = None, health_check_after: float = 30.0,
+                 statement_cache_size: int = 256, **connect_kwargs: Any):
+        self.database = os.path.abspath(database)
+        self.max_size = max_size
+        self.timeout = timeout
+        self.pragmas = DEFAULT_PRAGMAS if pragmas is None else pragmas
+        self.health_check_after = health_check_after
+        self.connect_kwargs = connect_kwargs
+        self.connect_kwargs.setdefault("cached_statements", statement_cache_size)
+        self._idle: List[PooledConnection] = []
+        self._connections: List[PooledConnection] = []
+        self._retired_compiled = 0
+        self._retired_reused = 0
+        self._opened = 0
+        self._closed = False
+        self._lock = threading.Condition()
+        self.checkouts = 0
+        self.affinity_hits = 0
+        self.created = 0
+        self.discarded = 0
+        self.timeouts = 0
+        self.wait_time = 0.0
+
+    def acquire(self) -> PooledConnection:
+        """Check out a connection; hand it back with release()."""
+        thread = threading.get_ident()
+        start = time.monotonic()
+        conn: Optional[PooledConnection] = None
+        with self._lock:
+            while True:
+                if self._closed:
+                    raise sqlite3.ProgrammingError("Connection pool is closed")
+                if self._idle:
+                    conn = self._take_idle(thread)
+                    break
+                if self._opened < self.max_size:
+                    self._opened += 1
+                    break
+                remaining = self.timeout - (time.monotonic() - start)
+                if remaining <= 0:
+                    self.timeouts += 1
+                    raise PoolTimeout(f"No connection to {self.database} available after {self.timeout}s")
+                self._lock.wait(remaining)
+
+        try:
+            if conn is not None and not self._is_healthy(conn):
+                self._close_quietly(conn)
+                with self._lock:
+                    self.discarded += 1
+                    self._retire(conn)
+                conn = None
+            if conn is None:
+                conn = self._connect()
+        except BaseException:
+            with self._lock:
+                self._opened -= 1
+                self._lock.notify()
+            raise
+
+        conn.owner_thread = thread
+        with self._lock:
+            self.checkouts += 1
+            self.wait_time += time.monotonic() - start
+        return conn
+
+    def release(self, conn: PooledConnection, discard: bool = False) -> None:
+        """Return a connection to the pool, or close it if discard is True."""
+        if not discard:
+            try:
+                if conn.in_transaction:
+                    conn.rollback()
+            except sqlite3.Error:
+                discard = True
+
+        with self._lock:
+            if not discard and not self._closed:
+                conn.last_used = time.monotonic()
+                self._idle.append(conn)
+                self._lock.notify()
+                return
+            self._opened -= 1
+            self.discarded += 1
+            self._retire(conn)
+            self._lock.notify()
+        self._close_quietly(conn)
+
+    @contextmanager
+    def connection(self) -> Iterator[PooledConnection]:
+        """Context manager that checks a connection out and returns it afterwards."""
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close(self) -> None:
+        """Close idle connections; connections still checked out close on release."""
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._opened -= len(idle)
+            for conn in idle:
+                self._retire(conn)
+            self._lock.notify_all()
+        for conn in idle:
+            self._close_quietly(conn)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return checkout counters and current occupancy."""
+        with self._lock:
+            live = [c.statements for c in self._connections if isinstance(c, PooledConnection)]
+            compiled = self._retired_compiled + sum(s.compiled for s in live)
+            reused = self._retired_reused + sum(s.reused for s in live)
+            return {
+                "checkouts": self.checkouts,
+                "affinity_hits": self.affinity_hits,
+                "created": self.created,
+                "discarded": self.discarded,
+                "timeouts": self.timeouts,
+                "wait_time": self.wait_time,
+                "opened": self._opened,
+                "idle": len(self._idle),
+                "in_use": self._opened - len(self._idle),
+                "statements_compiled": compiled,
+                "statements_reused": reused,
+            }
+
+    def _take_idle(self, thread: int) -> PooledConnection:
+        # Called with the lock held; prefer the connection this thread used last
+        for index in range(len(self._idle) - 1, -1, -1):
+            if self._idle[index].owner_thread == thread:
+                self.affinity_hits += 1
+                return self._idle.pop(index)
+        return self._idle.pop()
+
+    def _connect(self) -> PooledConnection:
+        kwargs = dict(self.connect_kwargs)
+        kwargs.setdefault("check_same_thread", False)
+        kwargs.setdefault("factory", PooledConnection)
+        conn = sqlite3.connect(self.database, **kwargs)
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name}={value}").fetchall()
+        conn.database = self.database
+        with self._lock:
+            self.created += 1
+            self._connections.append(conn)
+        return conn
+
+    def _retire(self, conn: PooledConnection) -> None:
+        # Called with the lock held; keep the statement counters of closed connections
+        if conn in self._connections:
+            self._connections.remove(conn)
+        if isinstance(conn, PooledConnection):
+            self._retired_compiled += conn.statements.compiled
+            self._retired_reused += conn.statements.reused
+
+    def _is_healthy(self, conn: PooledConnection) -> bool:
+        if time.monotonic() - conn.last_used < self.health_check_after:
+            return True
+        try:
+            conn.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    @staticmethod
+    def _close_quietly(conn: sqlite3.Connection) -> None:
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+
+_pools: Dict[str, SQLitePool] = {}
+_pools_pid = os.getpid()
+_pools_lock = threading.Lock()
+
+
+def get_pool(database: str = 'users.db', **pool_kwargs: Any) -> SQLitePool:
+    """Return the process-wide pool for database, creating it on first use.
+
+    pool_kwargs only apply when the pool is created. Pool sizes can also be
+    set with the DB_POOL_SIZE, DB_POOL_TIMEOUT and DB_STATEMENT_CACHE_SIZE
+    environment variables. A forked child process starts with fresh pools
+    instead of sharing its parent's connections.
+    """
+    global _pools_pid
+    path = os.path.abspath(database)
+    with _pools_lock:
+        if _pools_pid != os.getpid():
+            _pools.clear()
+            _pools_pid = os.getpid()
+        pool = _pools.get(path)
+        if pool is None:
+            pool_kwargs.setdefault("max_size", int(os.environ.get("DB_POOL_SIZE", "8")))
+            pool_kwargs.setdefault("timeout", float(os.environ.get("DB_POOL_TIMEOUT", "5")))
+            pool_kwargs.setdefault("statement_cache_size", int(os.environ.get("DB_STATEMENT_CACHE_SIZE", "256")))
+            pool = _pools[path] = SQLitePool(path, **pool_kwargs)
+        return pool
+
+
+class AsyncSQLitePool:
+    """Pool of aiosqlite connections to one database file, for one event loop.
+
+    The asyncio counterpart of SQLitePool: connections are opened lazily up
+    to max_size with the same pragmas and statement cache, callers wait up
+    to timeout seconds for a free connection without blocking the loop, and
+    open transactions are rolled back when a connection is returned. Each
+    aiosqlite connection runs its queries on its own thread, so up to
+    max_size queries proceed concurrently while the loop keeps serving
+    other tasks.
+    """
+
+    def __init__(self, database: str, max_size: int = 8, timeout: float = 5.0,
+                 pragmas: Optional[Dict[str, Any]] = None, statement_cache_size: int = 256,
+                 **connect_kwargs: Any):
+        if aiosqlite is None:
+            raise ImportError("AsyncSQLitePool requires the aiosqlite package")
+        self.database = os.path.abspath(database)
+        self.max_size = max_size
+        self.timeout = timeout
+        self.pragmas = DEFAULT_PRAGMAS if pragmas is None else pragmas
+        self.connect_kwargs = connect_kwargs
+        self.connect_kwargs.setdefault("cached_statements", statement_cache_size)
+        self._idle: List["aiosqlite.Connection"] = []
+        self._slots = asyncio.Semaphore(max_size)
+        self._opened = 0
+        self._closed = False
+        self.checkouts = 0
+        self.created = 0
+        self.discarded = 0
+        self.timeouts = 0
+        self.wait_time = 0.0
+
+    async def acquire(self) -> "aiosqlite.Connection":
+        """Check out a connection; hand it back with release()."""
+        if self._closed:
+            raise sqlite3.ProgrammingError("Connection pool is closed")
+        start = time.monotonic()
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise PoolTimeout(f"No connection to {self.database} available after {self.timeout}s") from None
+        try:
+            conn = self._idle.pop() if self._idle else await self._connect()
+        except BaseException:
+            self._slots.release()
+            raise
+        self.checkouts += 1
+        self.wait_time += time.monotonic() - start
+        return conn
+
+    async def release(self, conn: "aiosqlite.Connection", discard: bool = False) -> None:
+        """Return a connection to the pool, or close it if discard is True."""
+        try:
+            if not discard and conn.in_transaction:
+                await conn.rollback()
+        except sqlite3.Error:
+            discard = True
+        try:
+            if discard or self._closed:
+                self._opened -= 1
+                self.discarded += 1
+                await self._close_quietly(conn)
+            else:
+                self._idle.append(conn)
+        finally:
+            self._slots.release()
+
+    @asynccontextmanager
+    async def connection(self) -> AsyncIterator["aiosqlite.Connection"]:
+        """Async context manager that checks a connection out and returns it afterwards."""
+        conn = await self.acquire()
+        try:
+            yield conn
+        finally:
+            await self.release(conn)
+
+    async def close(self) -> None:
+        """Close idle connections; connections still checked out close on release."""
+        self._closed = True
+        idle, self._idle = self._idle, []
+        self._opened -= len(idle)
+        for conn in idle:
+            await self._close_quietly(conn)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return checkout counters and current occupancy."""
+        return {
+            "checkouts": self.checkouts,
+            "created": self.created,
+            "discarded": self.discarded,
+            "timeouts": self.timeouts,
+            "wait_time": self.wait_time,
+            "opened": self._opened,
+            "idle": len(self._idle),
+            "in_use": self._opened - len(self._idle),
+        }
+
+    async def _connect(self) -> "aiosqlite.Connection":
+        kwargs = dict(self.connect_kwargs)
+        kwargs.setdefault("factory", PooledConnection)
+        conn = await aiosqlite.connect(self.database, **kwargs)
+        try:
+            for name, value in self.pragmas.items():
+                await conn.execute_fetchall(f"PRAGMA {name}={value}")
+        except BaseException:
+            await self._close_quietly(conn)
+            raise
+        # Lets database_identity() name the database without a query
+        conn.database = self.database
+        self._opened += 1
+        self.created += 1
+        return conn
+
+    @staticmethod
+    async def _close_quietly(conn: "aiosqlite.Connection") -> None:
+        try:
+            await conn.close()
+        except sqlite3.Error:
+            pass
+
+
+_async_pools: Dict[Any, AsyncSQLitePool] = {}
+
+
+def get_async_pool(database: str = 'users.db', **pool_kwargs: Any) -> AsyncSQLitePool:
+    """Return the AsyncSQLitePool for database on the running event loop.
+
+    Like get_pool(), but pools belong to an event loop: asyncio primitives
+    and aiosqlite connections can't be shared between loops. Must be called
+    from a coroutine. The same environment variables set the defaults.
+
+    aiosqlite runs every connection on a non-daemon thread, so the pools of
+    a loop must be closed with close_async_pools() before the loop ends, or
+    the interpreter waits for those threads at exit.
+    """
+    loop = asyncio.get_running_loop()
+    path = os.path.abspath(database)
+    for key in [key for key in _async_pools if key[0].is_closed()]:
+        del _async_pools[key]
+    pool = _async_pools.get((loop, path))
+    if pool is None:
+        pool_kwargs.setdefault("max_size", int(os.environ.get("DB_POOL_SIZE", "8")))
+        pool_kwargs.setdefault("timeout", float(os.environ.get("DB_POOL_TIMEOUT", "5")))
+        pool_kwargs.setdefault("statement_cache_size", int(os.environ.get("DB_STATEMENT_CACHE_SIZE", "256")))
+        pool = _async_pools[(loop, path)] = AsyncSQLitePool(path, **pool_kwargs)
+    return pool
+
+
+async def close_async_pools() -> None:
+    """Close every AsyncSQLitePool of the running event loop."""
+    loop = asyncio.get_running_loop()
+    for key in [key for key in _async_pools if key[0] is loop]:
+        await _async_pools.pop(key).close()
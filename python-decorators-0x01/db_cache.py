@@ -0,0 +1,497 @@
+#!/usr/bin/env python3
+"""Module that provides a bounded query result cache with table-level invalidation"""
+
+import re
+import time
+import asyncio
+import sqlite3
+import threading
+import functools
+import logging
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, contextmanager
+from typing import (Any, AsyncIterator, Awaitable, Callable, Dict, FrozenSet, Hashable, Iterable, Iterator,
+                    Optional, Set, Tuple)
+
+from cache_backends import CacheBackend, CacheEntry, InProcessBackend, estimate_size  # noqa: F401
+
+logger = logging.getLogger(__name__)
+
+# Dependency used by entries whose tables could not be worked out from the SQL:
+# any write to their database invalidates them.
+ANY_TABLE = "*"
+# Dependency shared by every entry, bumped by writes that may touch any table (DDL).
+_EPOCH = ""
+
+_NAME = r'[`"\[]?([\w]+)[`"\]]?(?:\s*\.\s*[`"\[]?([\w]+)[`"\]]?)?'
+_READ_RE = re.compile(r'\b(?:FROM|JOIN)\s+' + _NAME, re.IGNORECASE)
+_COMMA_RE = re.compile(r',\s*' + _NAME, re.IGNORECASE)
+_FROM_LIST_RE = re.compile(r'\bFROM\s+([\w`"\[\]\s.,]+?)(?:\bWHERE\b|\bGROUP\b|\bORDER\b|\bLIMIT\b|\bJOIN\b|\)|;|$)',
+                           re.IGNORECASE)
+_WRITE_RE = re.compile(
+    r'\b(?:INSERT(?:\s+OR\s+\w+)?\s+INTO|REPLACE\s+INTO|UPDATE(?:\s+OR\s+\w+)?|DELETE\s+FROM)\s+' + _NAME,
+    re.IGNORECASE,
+)
+_DDL_RE = re.compile(r'^\s*(?:DROP|ALTER|CREATE)\b', re.IGNORECASE)
+
+
+def _table_name(match: "re.Match") -> str:
+    # "main.users" and "users" name the same table.
+    return (match.group(2) or match.group(1)).lower()
+
+
+@functools.lru_cache(maxsize=1024)
+def tables_read(query: str) -> FrozenSet[str]:
+    """Return the tables a SELECT reads from, or {ANY_TABLE} if unsure."""
+    tables = {_table_name(m) for m in _READ_RE.finditer(query)}
+    for from_list in _FROM_LIST_RE.finditer(query):
+        tables.update(_table_name(m) for m in _COMMA_RE.finditer(from_list.group(1)))
+    return frozenset(tables) or frozenset((ANY_TABLE,))
+
+
+@functools.lru_cache(maxsize=1024)
+def tables_written(query: str) -> FrozenSet[str]:
+    """Return the tables a statement modifies; DDL counts as writing every table."""
+    if _DDL_RE.match(query):
+        return frozenset((ANY_TABLE,))
+    return frozenset(_table_name(m) for m in _WRITE_RE.finditer(query))
+
+
+def database_identity(conn: sqlite3.Connection) -> str:
+    """Return a string identifying the database a connection is attached to.
+
+    File databases are identified by their path; in-memory databases are
+    private to their connection and are identified by the connection.
+    """
+    database = getattr(conn, "database", None)
+    if database:
+        return database
+    for _, name, path in conn.execute("PRAGMA database_list"):
+        if name == "main":
+            return path or f":memory:{id(conn)}"
+    return f":memory:{id(conn)}"
+
+
+async def adatabase_identity(conn: Any) -> str:
+    """database_identity() for aiosqlite connections."""
+    database = getattr(conn, "database", None)
+    if isinstance(database, str) and database:
+        return database
+    for _, name, path in await conn.execute_fetchall("PRAGMA database_list"):
+        if name == "main":
+            return path or f":memory:{id(conn)}"
+    return f":memory:{id(conn)}"
+
+
+# Entry states
+_FRESH, _STALE, _DEAD = "fresh", "stale", "dead"
+
+
+class _Flight:
+    """A load in progress that concurrent callers of the same key wait on."""
+    __slots__ = ("done", "value", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class QueryCache:
+    """Thread-safe cache of query results.
+
+    Entries are kept by a backend (see cache_backends): by default an
+    InProcessBackend that evicts least recently used entries once either
+    max_entries or max_bytes would be exceeded. SharedMemoryBackend,
+    SQLiteBackend and RedisBackend share entries between processes and size
+    themselves, ignoring max_entries and max_bytes.
+
+    Entries expire ttl seconds after being stored (never when ttl is None).
+    Every entry records which tables it was read from; writing to one of
+    those tables through invalidate_tables(), which the transactional
+    decorator calls on commit, drops it.
+
+    Each table has a generation number that invalidation bumps. Entries
+    remember the generations seen before their query ran, so a result
+    computed concurrently with a write is never served after that write.
+
+    get_or_load() fills the cache single-flight: concurrent callers missing
+    the same key wait for the one caller that runs the query. With
+    stale_ttl, an entry that expired less than stale_ttl seconds ago is
+    still served while one background refresh replaces it. Invalidated
+    entries are never served stale.
+    """
+
+    def __init__(self, max_entries: int = 1024, max_bytes: Optional[int] = None,
+                 ttl: Optional[float] = None, stale_ttl: float = 0.0, refresh_workers: int = 2,
+                 backend: Optional[CacheBackend] = None):
+        self.backend = backend if backend is not None else InProcessBackend(max_entries, max_bytes)
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.refresh_workers = refresh_workers
+        self._inflight: Dict[Hashable, _Flight] = {}
+        self._async_inflight: Dict[Tuple[asyncio.AbstractEventLoop, Hashable], "asyncio.Future"] = {}
+        self._refresher: Optional[ThreadPoolExecutor] = None
+        self._refresh_tasks: Set["asyncio.Task"] = set()
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self.stale_hits = 0
+        self.coalesced = 0
+        self.refreshes = 0
+        _caches.add(self)
+
+    @staticmethod
+    def make_key(database: str, query: str, params: Any = ()) -> Hashable:
+        """Build the cache key of a query: database, SQL text and bound parameters."""
+        if isinstance(params, dict):
+            params = tuple(sorted(params.items()))
+        elif isinstance(params, list):
+            params = tuple(params)
+        return (database, query, params)
+
+    def generations(self, database: str, tables: Optional[Iterable[str]] = None) -> Any:
+        """Snapshot the table generations of a database; take it before running a query.
+
+        Pass the tables the query reads to snapshot only those.
+        """
+        if tables is not None:
+            tables = (*tables, _EPOCH)
+        return self.backend.generations(database, tables)
+
+    def get(self, key: Hashable) -> Tuple[bool, Any]:
+        """Return (True, value) on a hit and (False, None) on a miss."""
+        entry = self.backend.load(key)
+        state = self._state(entry)
+        with self._lock:
+            if state != _FRESH:
+                self.misses += 1
+                return False, None
+            self.hits += 1
+        self.backend.touch(key)
+        return True, entry.value
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], Any], database: str, tables: Iterable[str],
+                    ttl: Optional[float] = None, refresh: Optional[Callable[[], Any]] = None) -> Any:
+        """Return the cached value of key, running loader() once on a miss.
+
+        Callers that miss while another caller is already loading the same
+        key wait for its result (or its exception) instead of running the
+        query again. refresh is used to reload a stale entry in the
+        background; it must not depend on resources owned by the caller,
+        such as a connection that is closed when the call returns. Without
+        it stale entries are treated as misses.
+
+        Single-flight applies within a process; processes sharing a backend
+        each run at most one load per key.
+        """
+        entry = self.backend.load(key)
+        state = self._state(entry)
+        with self._lock:
+            if entry is not None:
+                if state == _FRESH or (state == _STALE and refresh is not None):
+                    if state == _FRESH:
+                        self.hits += 1
+                    else:
+                        self.stale_hits += 1
+                        self._start_refresh(key, refresh, database, tables, ttl)
+                    self.backend.touch(key)
+                    return entry.value
+
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = _Flight()
+                self.misses += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+        if entry is not None:
+            self.backend.delete(key)
+        return self._fill(key, flight, loader, database, tables, ttl)
+
+    def set(self, key: Hashable, value: Any, database: str, tables: Iterable[str],
+            generations: Any = None, ttl: Optional[float] = None) -> None:
+        """Store a result read from the given tables of database.
+
+        generations should be the snapshot returned by generations() before
+        the query ran; if a table was invalidated since, the value is dropped.
+        """
+        ttl = self.ttl if ttl is None else ttl
+        tables = (*tables, _EPOCH)
+        seen = generations if generations is not None else self.backend.generations(database, tables)
+        dependencies = {table: seen.get(table, 0) for table in tables}
+        if generations is not None:
+            current = self.backend.generations(database, dependencies)
+            if any(current.get(table, 0) != gen for table, gen in dependencies.items()):
+                return
+
+        expires_at = time.time() + ttl if ttl is not None else None
+        stale_until = expires_at + self.stale_ttl if expires_at is not None else None
+        try:
+            self.backend.store(key, CacheEntry(value, expires_at, stale_until, database, dependencies))
+        except (TypeError, ValueError) as e:
+            logger.warning(f"Result could not be cached: {e}")
+
+    def invalidate_tables(self, database: str, tables: Iterable[str]) -> int:
+        """Drop every entry read from one of tables; return how many were dropped.
+
+        Passing ANY_TABLE drops every entry of the database. Shared backends
+        drop entries lazily, when they are next read, and report 0.
+        """
+        tables = set(tables)
+        if not tables:
+            return 0
+        if ANY_TABLE in tables:
+            tables.add(_EPOCH)
+        tables.add(ANY_TABLE)
+        dropped = self.backend.bump(database, tables)
+        with self._lock:
+            self.invalidations += dropped
+        return dropped
+
+    def clear(self) -> None:
+        self.backend.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss/eviction counters and current occupancy."""
+        with self._lock:
+            stats = {
+                "hits": self.hits,
+                "misses": self.misses,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+                "stale_hits": self.stale_hits,
+                "coalesced": self.coalesced,
+                "refreshes": self.refreshes,
+            }
+        stats.update(self.backend.stats())
+        return stats
+
+    def __len__(self) -> int:
+        return len(self.backend)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self._state(self.backend.load(key)) == _FRESH
+
+    def _state(self, entry: Optional[CacheEntry]) -> str:
+        if entry is None:
+            return _DEAD
+        current = self.backend.generations(entry.database, entry.dependencies)
+        if any(current.get(table, 0) != gen for table, gen in entry.dependencies.items()):
+            return _DEAD
+        if entry.expires_at is None:
+            return _FRESH
+        now = time.time()
+        if now < entry.expires_at:
+            return _FRESH
+        if now < entry.stale_until:
+            return _STALE
+        with self._lock:
+            self.expirations += 1
+        return _DEAD
+
+    def _fill(self, key: Hashable, flight: _Flight, loader: Callable[[], Any], database: str,
+              tables: Iterable[str], ttl: Optional[float]) -> Any:
+        tables = tuple(tables)
+        generations = self.generations(database, tables)
+        try:
+            flight.value = loader()
+            self.set(key, flight.value, database, tables, generations, ttl=ttl)
+            return flight.value
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            flight.done.set()
+
+    def _start_refresh(self, key: Hashable, refresh: Callable[[], Any], database: str,
+                       tables: Iterable[str], ttl: Optional[float]) -> None:
+        # Called with the lock held.
+        if key in self._inflight:
+            return
+        flight = self._inflight[key] = _Flight()
+        self.refreshes += 1
+        if self._refresher is None:
+            self._refresher = ThreadPoolExecutor(max_workers=self.refresh_workers,
+                                                 thread_name_prefix="query-cache-refresh")
+
+        def run() -> None:
+            try:
+                self._fill(key, flight, refresh, database, tables, ttl)
+            except Exception as e:
+                logger.warning(f"Background refresh failed, keeping stale entry: {e}")
+
+        self._refresher.submit(run)
+
+    async def aget_or_load(self, key: Hashable, loader: Callable[[], Awaitable[Any]], database: str,
+                           tables: Iterable[str], ttl: Optional[float] = None,
+                           refresh: Optional[Callable[[], Awaitable[Any]]] = None) -> Any:
+        """get_or_load() for coroutines: loader and refresh are coroutine functions.
+
+        Tasks of one event loop missing the same key await a single load;
+        stale entries are refreshed by a background task on the same loop.
+        Loads on different loops, or through get_or_load(), aren't coalesced
+        with each other. Calls into a shared backend run in the loop's default
+        executor so that their I/O doesn't block the loop.
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            entry, state = await self._in_executor(self._lookup, key)
+            hit = False
+            with self._lock:
+                if entry is not None:
+                    if state == _FRESH or (state == _STALE and refresh is not None):
+                        if state == _FRESH:
+                            self.hits += 1
+                        else:
+                            self.stale_hits += 1
+                            self._start_async_refresh(loop, key, refresh, database, tables, ttl)
+                        hit = True
+
+                if not hit:
+                    flight = self._async_inflight.get((loop, key))
+                    leader = flight is None
+                    if leader:
+                        flight = self._async_inflight[(loop, key)] = loop.create_future()
+                        flight.add_done_callback(_retrieve_exception)
+                        self.misses += 1
+                    else:
+                        self.coalesced += 1
+
+            if hit:
+                await self._in_executor(self.backend.touch, key)
+                return entry.value
+            if leader:
+                if entry is not None:
+                    await self._in_executor(self.backend.delete, key)
+                return await self._afill(loop, key, flight, loader, database, tables, ttl)
+            try:
+                # shield: a waiter being cancelled must not cancel the shared load
+                return await asyncio.shield(flight)
+            except asyncio.CancelledError:
+                # If the task running the load was cancelled rather than this
+                # one, try again: the next waiter becomes the leader
+                task = asyncio.current_task()
+                if not flight.cancelled() or getattr(task, "cancelling", lambda: 0)():
+                    raise
+
+    async def _afill(self, loop: asyncio.AbstractEventLoop, key: Hashable, flight: "asyncio.Future",
+                     loader: Callable[[], Awaitable[Any]], database: str, tables: Iterable[str],
+                     ttl: Optional[float]) -> Any:
+        tables = tuple(tables)
+        try:
+            generations = await self._in_executor(self.generations, database, tables)
+            value = await loader()
+            await self._in_executor(self.set, key, value, database, tables, generations, ttl)
+            flight.set_result(value)
+            return value
+        except asyncio.CancelledError:
+            flight.cancel()
+            raise
+        except BaseException as e:
+            flight.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._async_inflight.pop((loop, key), None)
+
+    def _lookup(self, key: Hashable) -> Tuple[Optional[CacheEntry], str]:
+        entry = self.backend.load(key)
+        return entry, self._state(entry)
+
+    async def _in_executor(self, func: Callable[..., Any], *args: Any) -> Any:
+        # Shared backends do file or network I/O; keep it off the event loop
+        if isinstance(self.backend, InProcessBackend):
+            return func(*args)
+        return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+    def _start_async_refresh(self, loop: asyncio.AbstractEventLoop, key: Hashable,
+                             refresh: Callable[[], Awaitable[Any]], database: str,
+                             tables: Iterable[str], ttl: Optional[float]) -> None:
+        # Called with the lock held.
+        if (loop, key) in self._async_inflight:
+            return
+        flight = self._async_inflight[(loop, key)] = loop.create_future()
+        flight.add_done_callback(_retrieve_exception)
+        self.refreshes += 1
+
+        async def run() -> None:
+            try:
+                await self._afill(loop, key, flight, refresh, database, tables, ttl)
+            except Exception as e:
+                logger.warning(f"Background refresh failed, keeping stale entry: {e}")
+
+        task = loop.create_task(run())
+        # The loop only keeps weak references to tasks
+        self._refresh_tasks.add(task)
+        task.add_done_callback(self._refresh_tasks.discard)
+
+
+def _retrieve_exception(future: "asyncio.Future") -> None:
+    # Marks a failed load as handled when no other task was waiting on it
+    if not future.cancelled():
+        future.exception()
+
+
+_caches: "weakref.WeakSet[QueryCache]" = weakref.WeakSet()
+
+
+def invalidate_tables(database: str, tables: Iterable[str]) -> None:
+    """Invalidate the given tables of database in every QueryCache."""
+    tables = frozenset(tables)
+    if tables:
+        for cache in list(_caches):
+            cache.invalidate_tables(database, tables)
+
+
+async def ainvalidate_tables(database: str, tables: Iterable[str]) -> None:
+    """invalidate_tables() for coroutines; shared backends are updated off the event loop."""
+    tables = frozenset(tables)
+    if tables:
+        for cache in list(_caches):
+            await cache._in_executor(cache.invalidate_tables, database, tables)
+
+
+@contextmanager
+def track_writes(conn: sqlite3.Connection) -> Iterator[Set[str]]:
+    """Collect the tables written by statements executed on conn inside the block.
+
+    Statements are observed through the connection's trace callback, which
+    unlike an authorizer does not expire the connection's prepared statements.
+    """
+    written: Set[str] = set()
+
+    def trace(statement: str) -> None:
+        written.update(tables_written(statement))
+
+    conn.set_trace_callback(trace)
+    try:
+        yield written
+    finally:
+        conn.set_trace_callback(None)
+
+
+@asynccontextmanager
+async def async_track_writes(conn: Any) -> AsyncIterator[Set[str]]:
+    """track_writes() for aiosqlite connections."""
+    written: Set[str] = set()
+
+    def trace(statement: str) -> None:
+        written.update(tables_written(statement))
+
+    await conn.set_trace_callback(trace)
+    try:
+        yield written
+    finally:
+        await conn.set_trace_callback(None)
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""Unit tests for cache_backends."""
+
+import os
+import time
+import fcntl
+import tempfile
+import unittest
+
+from cache_backends import CacheEntry, SharedMemoryBackend, SQLiteBackend, key_digest
+
+
+class TestKeyDigest(unittest.TestCase):
+    """Test that equal keys always get the same digest"""
+
+    def test_repeated_objects(self):
+        """Test a repeated object digests like an equal copy"""
+        s = "alice@example.com"
+        t = "".join(["alice", "@example.com"])
+        self.assertIsNot(s, t)
+        self.assertEqual(key_digest(("db", "q", (s, s))), key_digest(("db", "q", (s, t))))
+
+    def test_sets_and_dicts(self):
+        """Test unordered containers digest the same whatever their order"""
+        self.assertEqual(key_digest(frozenset(["a", "b", "c"])), key_digest(frozenset(["c", "b", "a"])))
+        self.assertEqual(key_digest({"a": 1, "b": 2}), key_digest({"b": 2, "a": 1}))
+
+    def test_distinct_keys(self):
+        """Test keys differing in value or type get different digests"""
+        self.assertNotEqual(key_digest(("q", (1,))), key_digest(("q", ("1",))))
+        self.assertNotEqual(key_digest(("q", ("a,b",))), key_digest(("q", ("a", "b"))))
+
+
+class TestSharedMemoryBackend(unittest.TestCase):
+    """Test SharedMemoryBackend storage and locking"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.backend = SharedMemoryBackend(path=os.path.join(directory.name, "cache"), slots=16,
+                                           slot_size=1024, generation_slots=16)
+        self.addCleanup(self.backend.close)
+
+    def test_store_and_load(self):
+        """Test a stored entry loads back"""
+        self.backend.store("key", CacheEntry([(1, "a")], None, None, "db", {"users": 0}))
+        self.assertEqual(self.backend.load("key").value, [(1, "a")])
+
+    def test_torn_slot_is_a_miss(self):
+        """Test an entry that can't be decoded is dropped instead of raising"""
+        self.backend.store("key", CacheEntry([(1, "a")], None, None, "db", {"users": 0}))
+        offset = self.backend._find(key_digest("key"))
+        start = offset + self.backend._SLOT.size
+        self.backend._map[start:start + 8] = b"\xff" * 8
+        self.assertIsNone(self.backend.load("key"))
+        self.assertIsNone(self.backend._find(key_digest("key")))
+
+    def test_forked_child_gets_its_own_lock(self):
+        """Test flock still excludes the parent after a fork"""
+        read_end, write_end = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            try:
+                os.close(read_end)
+                with self.backend._locked(exclusive=True):
+                    os.write(write_end, b"locked")
+                    time.sleep(0.5)
+            finally:
+                os._exit(0)
+        os.close(write_end)
+        self.assertEqual(os.read(read_end, 6), b"locked")
+        os.close(read_end)
+        with self.assertRaises(BlockingIOError):
+            fcntl.flock(self.backend._fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        os.waitpid(pid, 0)
+
+
+class TestSQLiteBackend(unittest.TestCase):
+    """Test SQLiteBackend storage"""
+
+    def test_undecodable_record_is_a_miss(self):
+        """Test a record written by another version is dropped instead of raising"""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        backend = SQLiteBackend(os.path.join(directory.name, "cache.db"))
+        backend._conn().execute("INSERT INTO entries VALUES (?, ?, 0)", (key_digest("key"), b"garbage"))
+        self.assertIsNone(backend.load("key"))
+        self.assertEqual(len(backend), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
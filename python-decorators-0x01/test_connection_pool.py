@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""Unit tests for connection_pool.SQLitePool."""
+
+import os
+import tempfile
+import threading
+import unittest
+
+from connection_pool import PoolTimeout, SQLitePool
+
+
+class TestSQLitePool(unittest.TestCase):
+    """Test checkout limits, timeouts and discarding"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.pool = SQLitePool(os.path.join(directory.name, "pool.db"), max_size=1, timeout=0.1)
+        self.addCleanup(self.pool.close)
+
+    def test_reuses_released_connection(self):
+        """Test a released connection is handed out again"""
+        conn = self.pool.acquire()
+        self.pool.release(conn)
+        self.assertIs(self.pool.acquire(), conn)
+        self.assertEqual(self.pool.stats()["created"], 1)
+
+    def test_times_out_when_exhausted(self):
+        """Test acquire raises PoolTimeout when every connection is in use"""
+        self.pool.acquire()
+        with self.assertRaises(PoolTimeout):
+            self.pool.acquire()
+        self.assertEqual(self.pool.stats()["timeouts"], 1)
+
+    def test_discard_wakes_waiter(self):
+        """Test discarding a connection lets a waiting thread open a new one"""
+        self.pool.timeout = 5
+        conn = self.pool.acquire()
+        acquired = []
+        waiter = threading.Thread(target=lambda: acquired.append(self.pool.acquire()))
+        waiter.start()
+        self.pool.release(conn, discard=True)
+        waiter.join(5)
+
+        self.assertEqual(len(acquired), 1)
+        self.assertIsNot(acquired[0], conn)
+        stats = self.pool.stats()
+        self.assertEqual((stats["discarded"], stats["created"], stats["opened"]), (1, 2, 1))
+
+    def test_release_rolls_back(self):
+        """Test uncommitted changes are discarded when a connection is returned"""
+        with self.pool.connection() as conn:
+            conn.execute("CREATE TABLE t (x)")
+        with self.pool.connection() as conn:
+            conn.execute("INSERT INTO t VALUES (1)")
+        with self.pool.connection() as conn:
+            self.assertEqual(conn.execute("SELECT COUNT(*) FROM t").fetchone(), (0,))
+
+
+if __name__ == "__main__":
+    unittest.main()
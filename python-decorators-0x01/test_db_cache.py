@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""Unit tests for db_cache.QueryCache and its backends."""
+
+import os
+import time
+import tempfile
+import threading
+import unittest
+
+from cache_backends import SharedMemoryBackend
+from db_cache import QueryCache
+
+
+class TestSingleFlight(unittest.TestCase):
+    """Test that concurrent misses of one key run the loader once"""
+
+    def test_concurrent_loads_collapse(self):
+        """Test threads missing the same key share one load"""
+        cache = QueryCache()
+        key = cache.make_key("db", "SELECT * FROM users")
+        calls = []
+        release = threading.Event()
+
+        def loader():
+            calls.append(1)
+            release.wait(5)
+            return [(1, "Alice")]
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(
+            cache.get_or_load(key, loader, "db", ["users"]))) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        while cache.stats()["coalesced"] < 7:
+            time.sleep(0.01)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [[(1, "Alice")]] * 8)
+        self.assertEqual(cache.stats()["misses"], 1)
+
+    def test_waiters_get_the_loader_error(self):
+        """Test a failing load raises in every waiting caller"""
+        cache = QueryCache()
+        key = cache.make_key("db", "SELECT * FROM users")
+        release = threading.Event()
+
+        def loader():
+            release.wait(5)
+            raise RuntimeError("boom")
+
+        errors = []
+
+        def call():
+            try:
+                cache.get_or_load(key, loader, "db", ["users"])
+            except RuntimeError as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=call) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        while cache.stats()["coalesced"] < 3:
+            time.sleep(0.01)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(len(errors), 4)
+        self.assertNotIn(key, cache)
+
+
+class TestInvalidation(unittest.TestCase):
+    """Test that generation bumps invalidate cached entries"""
+
+    def make_cache(self):
+        return QueryCache()
+
+    def test_bump_invalidates_dependent_entries(self):
+        """Test writing a table drops entries read from it, and only those"""
+        cache = self.make_cache()
+        users = cache.make_key("db", "SELECT * FROM users")
+        orders = cache.make_key("db", "SELECT * FROM orders")
+        cache.set(users, [1], "db", ["users"])
+        cache.set(orders, [2], "db", ["orders"])
+
+        cache.invalidate_tables("db", ["users"])
+        self.assertEqual(cache.get(users), (False, None))
+        self.assertEqual(cache.get(orders), (True, [2]))
+
+    def test_other_database_is_untouched(self):
+        """Test a bump only applies to its own database"""
+        cache = self.make_cache()
+        key = cache.make_key("db", "SELECT * FROM users")
+        cache.set(key, [1], "db", ["users"])
+        cache.invalidate_tables("other", ["users"])
+        self.assertEqual(cache.get(key), (True, [1]))
+
+    def test_write_during_load_is_not_cached(self):
+        """Test a result computed concurrently with a write is never served"""
+        cache = self.make_cache()
+        key = cache.make_key("db", "SELECT * FROM users")
+
+        def loader():
+            cache.invalidate_tables("db", ["users"])
+            return ["before the write"]
+
+        self.assertEqual(cache.get_or_load(key, loader, "db", ["users"]), ["before the write"])
+        self.assertNotIn(key, cache)
+        self.assertEqual(cache.get_or_load(key, lambda: ["after"], "db", ["users"]), ["after"])
+        self.assertIn(key, cache)
+
+
+class TestSharedMemoryInvalidation(TestInvalidation):
+    """Run the invalidation tests against SharedMemoryBackend"""
+
+    def make_cache(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        backend = SharedMemoryBackend(path=os.path.join(directory.name, "cache"), slots=64,
+                                      slot_size=1024, generation_slots=64)
+        self.addCleanup(backend.close)
+        return QueryCache(backend=backend)
+
+    def test_unmarshallable_values_are_not_cached(self):
+        """Test values marshal can't encode are skipped rather than pickled"""
+        cache = self.make_cache()
+        key = cache.make_key("db", "SELECT * FROM users")
+        with self.assertLogs("db_cache", "WARNING"):
+            cache.set(key, [object()], "db", ["users"])
+        self.assertNotIn(key, cache)
+
+
+if __name__ == "__main__":
+    unittest.main()
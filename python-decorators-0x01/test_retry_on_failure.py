@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""Unit tests for the retry decorator and circuit breaker in 3-retry_on_failure.py."""
+
+import time
+import sqlite3
+import asyncio
+import importlib
+import threading
+import unittest
+from unittest import mock
+
+retry_module = importlib.import_module("3-retry_on_failure")
+CircuitBreaker = retry_module.CircuitBreaker
+CircuitOpenError = retry_module.CircuitOpenError
+RetryBudget = retry_module.RetryBudget
+is_transient = retry_module.is_transient
+retry_on_failure = retry_module.retry_on_failure
+
+
+def failing():
+    raise sqlite3.OperationalError("unable to open database file")
+
+
+def flaky(failures, error=None):
+    """Return a function that raises error failures times, then returns "ok"."""
+    calls = []
+
+    def func():
+        calls.append(1)
+        if len(calls) <= failures:
+            raise error or sqlite3.OperationalError("database is locked")
+        return "ok"
+
+    func.calls = calls
+    return func
+
+
+class FakeClock:
+    """Stands in for time.monotonic and time.sleep so waits take no time"""
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class TestIsTransient(unittest.TestCase):
+    """Test which errors are worth retrying"""
+
+    def test_lock_contention_is_transient(self):
+        """Test locked and busy errors are retried"""
+        self.assertTrue(is_transient(sqlite3.OperationalError("database is locked")))
+        self.assertTrue(is_transient(sqlite3.OperationalError("database table is locked: users")))
+        self.assertTrue(is_transient(sqlite3.OperationalError("Database Busy")))
+
+    def test_other_errors_are_not(self):
+        """Test errors that fail the same way every time are not retried"""
+        self.assertFalse(is_transient(sqlite3.OperationalError("no such table: users")))
+        self.assertFalse(is_transient(sqlite3.IntegrityError("database is locked")))
+        self.assertFalse(is_transient(ValueError("locked")))
+
+
+class TestRetryOnFailure(unittest.TestCase):
+    """Test backoff, retry limits, the budget and the deadline"""
+
+    def setUp(self):
+        self.clock = FakeClock()
+        for name in ("monotonic", "sleep"):
+            patcher = mock.patch.object(retry_module.time, name, getattr(self.clock, name))
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        # Always wait the longest time full jitter allows
+        patcher = mock.patch.object(retry_module.random, "uniform", side_effect=lambda low, high: high)
+        self.uniform = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_full_jitter_backoff(self):
+        """Test waits are drawn from [0, delay * 2 ** (attempt - 1)] capped at max_delay"""
+        func = flaky(4)
+        guarded = retry_on_failure(retries=4, delay=1, max_delay=3, budget=None)(func)
+        with self.assertLogs(retry_module.logger, "WARNING"):
+            self.assertEqual(guarded(), "ok")
+        self.assertEqual(self.uniform.call_args_list,
+                         [mock.call(0, 1), mock.call(0, 2), mock.call(0, 3), mock.call(0, 3)])
+        self.assertEqual(self.clock.sleeps, [1, 2, 3, 3])
+
+    def test_raises_after_last_retry(self):
+        """Test the last error is raised once the retries are used up"""
+        func = flaky(10)
+        guarded = retry_on_failure(retries=2, delay=1, budget=None)(func)
+        with self.assertLogs(retry_module.logger, "ERROR"):
+            with self.assertRaises(sqlite3.OperationalError):
+                guarded()
+        self.assertEqual(len(func.calls), 3)
+
+    def test_permanent_errors_are_not_retried(self):
+        """Test an error is_transient rejects is raised straight away"""
+        func = flaky(1, sqlite3.OperationalError("no such table: users"))
+        with self.assertRaises(sqlite3.OperationalError):
+            retry_on_failure(budget=None)(func)()
+        self.assertEqual(len(func.calls), 1)
+        self.assertEqual(self.clock.sleeps, [])
+
+    def test_retry_on_exception_types(self):
+        """Test retry_on also accepts a tuple of exception types"""
+        func = flaky(2, ConnectionError("reset"))
+        with self.assertLogs(retry_module.logger, "WARNING"):
+            self.assertEqual(retry_on_failure(retry_on=(ConnectionError,), budget=None)(func)(), "ok")
+        self.assertEqual(len(func.calls), 3)
+
+    def test_budget_exhaustion_stops_retries(self):
+        """Test no retry is made once the budget has no tokens left"""
+        budget = RetryBudget(ratio=0, min_per_second=0, max_tokens=1)
+        func = flaky(10)
+        guarded = retry_on_failure(retries=5, delay=1, budget=budget)(func)
+        with self.assertLogs(retry_module.logger, "ERROR") as logs:
+            with self.assertRaises(sqlite3.OperationalError):
+                guarded()
+        self.assertEqual(len(func.calls), 2)
+        self.assertIn("Retry budget exhausted", logs.output[-1])
+        self.assertEqual(budget.stats(), {"tokens": 0, "retries": 1, "exhausted": 1})
+
+    def test_budget_earns_tokens_per_call(self):
+        """Test each call deposits ratio tokens toward a later retry"""
+        budget = RetryBudget(ratio=0.5, min_per_second=0, max_tokens=10)
+        budget.tokens = 0
+        self.assertFalse(budget.try_spend())
+        budget.deposit()
+        budget.deposit()
+        self.assertTrue(budget.try_spend())
+        self.assertFalse(budget.try_spend())
+
+    def test_deadline_cuts_off_retries(self):
+        """Test no retry is started that would sleep past the deadline"""
+        func = flaky(10)
+        guarded = retry_on_failure(retries=5, delay=1, budget=None, deadline=2.5)(func)
+        with self.assertLogs(retry_module.logger, "ERROR") as logs:
+            with self.assertRaises(sqlite3.OperationalError):
+                guarded()
+        # The first wait ends at 1s; the second would end at 3s
+        self.assertEqual(self.clock.sleeps, [1])
+        self.assertEqual(len(func.calls), 2)
+        self.assertIn("Deadline of 2.5s reached", logs.output[-1])
+
+    def test_async_retries_with_asyncio_sleep(self):
+        """Test coroutine functions are retried without blocking the event loop"""
+        calls = []
+
+        async def fetch():
+            calls.append(1)
+            if len(calls) < 3:
+                raise sqlite3.OperationalError("database is busy")
+            return "ok"
+
+        guarded = retry_on_failure(retries=3, delay=1, budget=None)(fetch)
+        with mock.patch.object(retry_module.asyncio, "sleep", new=mock.AsyncMock()) as sleep:
+            with self.assertLogs(retry_module.logger, "WARNING"):
+                self.assertEqual(asyncio.run(guarded()), "ok")
+        self.assertEqual(sleep.await_args_list, [mock.call(1), mock.call(2)])
+        self.assertEqual(self.clock.sleeps, [])
+        self.assertEqual(len(calls), 3)
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    """Test the breaker's closed -> open -> half-open -> closed cycle"""
+
+    def make_breaker(self, **kwargs):
+        kwargs.setdefault("minimum_calls", 4)
+        kwargs.setdefault("reset_timeout", 0.05)
+        return CircuitBreaker(name="test", **kwargs)
+
+    def trip(self, breaker):
+        guarded = breaker(failing)
+        for _ in range(breaker.minimum_calls):
+            with self.assertRaises(sqlite3.OperationalError):
+                guarded()
+
+    def test_opens_after_failure_rate_and_fails_fast(self):
+        """Test the breaker opens once enough calls failed"""
+        breaker = self.make_breaker()
+        self.trip(breaker)
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+
+        calls = []
+        guarded = breaker(lambda: calls.append(1))
+        with self.assertRaises(CircuitOpenError):
+            guarded()
+        self.assertEqual(calls, [])
+        self.assertEqual(breaker.stats()["rejected"], 1)
+
+    def test_stays_closed_below_minimum_calls(self):
+        """Test a few failures don't open the breaker"""
+        breaker = self.make_breaker(minimum_calls=10)
+        guarded = breaker(failing)
+        for _ in range(5):
+            with self.assertRaises(sqlite3.OperationalError):
+                guarded()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+    def test_ignores_errors_outside_failure_on(self):
+        """Test errors that say nothing about the database don't count"""
+        breaker = self.make_breaker()
+
+        @breaker
+        def bad_argument():
+            raise ValueError("bad argument")
+
+        for _ in range(10):
+            with self.assertRaises(ValueError):
+                bad_argument()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+    def test_half_open_success_closes(self):
+        """Test a successful trial call closes the breaker"""
+        breaker = self.make_breaker()
+        self.trip(breaker)
+        time.sleep(0.06)
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertEqual(breaker(lambda: "ok")(), "ok")
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        self.assertEqual(breaker.stats()["transitions"],
+                         {"closed->open": 1, "open->half_open": 1, "half_open->closed": 1})
+
+    def test_half_open_failure_reopens(self):
+        """Test a failing trial call opens the breaker again"""
+        breaker = self.make_breaker()
+        self.trip(breaker)
+        time.sleep(0.06)
+        with self.assertRaises(sqlite3.OperationalError):
+            breaker(failing)()
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+
+    def test_half_open_admits_limited_trials(self):
+        """Test only half_open_calls trial calls run at once"""
+        breaker = self.make_breaker(half_open_calls=1)
+        self.trip(breaker)
+        time.sleep(0.06)
+        breaker.before_call()
+        with self.assertRaises(CircuitOpenError):
+            breaker.before_call()
+
+    def test_callback_can_read_state(self):
+        """Test on_transition callbacks may call back into the breaker"""
+        seen = []
+
+        def callback(name, previous, state):
+            seen.append((previous, state, breaker.state, breaker.stats()["state"]))
+
+        breaker = self.make_breaker(on_transition=[callback])
+        worker = threading.Thread(target=self.trip, args=(breaker,), daemon=True)
+        worker.start()
+        worker.join(timeout=5)
+        self.assertFalse(worker.is_alive(), "on_transition callback deadlocked")
+
+        time.sleep(0.06)
+        breaker(lambda: None)()
+        self.assertEqual(seen, [
+            ("closed", "open", "open", "open"),
+            ("open", "half_open", "half_open", "half_open"),
+            ("half_open", "closed", "closed", "closed"),
+        ])
+
+
+if __name__ == "__main__":
+    unittest.main()
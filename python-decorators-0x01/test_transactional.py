@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""Unit tests for the GroupCommitWriter in 2-transactional.py."""
+
+import os
+import sqlite3
+import tempfile
+import importlib
+import unittest
+
+transactional_module = importlib.import_module("2-transactional")
+GroupCommitWriter = transactional_module.GroupCommitWriter
+
+
+def insert_user(conn, user_id, email):
+    conn.execute("INSERT INTO users (id, email) VALUES (?, ?)", (user_id, email))
+    return user_id
+
+
+class TestGroupCommitWriter(unittest.TestCase):
+    """Test batching, per-unit savepoints and shutdown"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.database = os.path.join(directory.name, "users.db")
+        conn = sqlite3.connect(self.database)
+        conn.execute("CREATE TABLE users (id INTEGER PRIMARY KEY, email TEXT UNIQUE)")
+        conn.close()
+
+    def rows(self):
+        conn = sqlite3.connect(self.database)
+        try:
+            return conn.execute("SELECT id, email FROM users ORDER BY id").fetchall()
+        finally:
+            conn.close()
+
+    def test_failing_unit_is_isolated(self):
+        """Test a unit that fails only rolls back its own changes"""
+        writer = GroupCommitWriter(self.database, max_batch=3, max_latency=1.0)
+        futures = [
+            writer.submit(insert_user, 1, "a@example.com"),
+            writer.submit(insert_user, 2, "a@example.com"),  # violates UNIQUE
+            writer.submit(insert_user, 3, "c@example.com"),
+        ]
+        self.assertEqual(futures[0].result(5), 1)
+        self.assertIsInstance(futures[1].exception(5), sqlite3.IntegrityError)
+        self.assertEqual(futures[2].result(5), 3)
+        writer.close()
+
+        self.assertEqual(self.rows(), [(1, "a@example.com"), (3, "c@example.com")])
+        self.assertEqual(writer.stats()["batches"], 1)
+        self.assertEqual(writer.stats()["failed_units"], 1)
+
+    def test_close_applies_queued_units(self):
+        """Test close() waits for the units already submitted"""
+        writer = GroupCommitWriter(self.database)
+        futures = [writer.submit(insert_user, i, f"user{i}@example.com") for i in range(1, 51)]
+        writer.close()
+        self.assertTrue(all(future.done() for future in futures))
+        self.assertEqual(len(self.rows()), 50)
+
+    def test_submit_after_close_raises(self):
+        """Test a closed writer rejects new units"""
+        writer = GroupCommitWriter(self.database)
+        writer.close()
+        with self.assertRaises(RuntimeError):
+            writer.submit(insert_user, 1, "a@example.com")
+
+    def test_connection_failure_fails_units(self):
+        """Test a writer that can't connect fails its units instead of hanging"""
+        database = os.path.join(os.path.dirname(self.database), "missing", "users.db")
+        writer = GroupCommitWriter(database)
+        future = writer.submit(insert_user, 1, "a@example.com")
+        self.assertIsInstance(future.exception(5), sqlite3.OperationalError)
+        self.assertTrue(writer.closed)
+        later = writer.submit(insert_user, 2, "b@example.com")
+        self.assertIsInstance(later.exception(0), sqlite3.OperationalError)
+
+    def test_get_group_writer_replaces_closed_writer(self):
+        """Test the shared writer is restarted once it has closed"""
+        writer = transactional_module.get_group_writer(self.database)
+        writer.close()
+        replacement = transactional_module.get_group_writer(self.database)
+        self.addCleanup(replacement.close)
+        self.assertIsNot(replacement, writer)
+        self.assertEqual(replacement.submit(insert_user, 1, "a@example.com").result(5), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,17 +1,136 @@
 #!/usr/bin/env python3
+import sys
+from collections import namedtuple
+
 from seed import connect_to_prodev
 
-def stream_users():
-    """Generator that yields user records one at a time from the user_data table."""
+ROW_FORMATS = ("dict", "tuple", "namedtuple")
+
+
+def stream_users(chunk_size=None, row_format="dict", max_buffer_bytes=None):
+    """Generator that yields user records one at a time from the user_data table.
+
+    Called without arguments it yields one dict per row, as it always has.
+    Passing any of the keyword arguments switches to streaming mode: rows are
+    read from an unbuffered cursor with fetchmany(chunk_size), so only one
+    chunk is ever held on the client side.
+
+    row_format is one of "dict", "tuple" or "namedtuple". max_buffer_bytes
+    caps the estimated size of a chunk: the first fetch reads a single row to
+    estimate the row size, and every later chunk holds as many rows as fit
+    the cap at the size of the largest row seen so far. A single row that is
+    larger than the cap raises MemoryError.
+    """
+    if row_format not in ROW_FORMATS:
+        raise ValueError(f"row_format must be one of {ROW_FORMATS}, got {row_format!r}")
+
+    if chunk_size is None and max_buffer_bytes is None and row_format == "dict":
+        yield from _stream_dicts()
+        return
+
+    connection = connect_to_prodev()
+    if not connection:
+        return
+
+    try:
+        cursor = connection.cursor(buffered=False)
+        cursor.execute("SELECT * FROM user_data")
+        make_row = _row_maker(row_format, cursor.column_names)
+
+        for rows in _fetch_chunks(cursor, chunk_size or 1000, max_buffer_bytes):
+            if make_row is None:
+                yield from rows
+            else:
+                yield from map(make_row, rows)
+    finally:
+        # Closing the connection also discards any rows left unread on the
+        # server when the consumer stops early.
+        connection.close()
+
+
+def _stream_dicts():
     connection = connect_to_prodev()
     if not connection:
         return
 
-    cursor = connection.cursor(dictionary=True)
-    cursor.execute("SELECT * FROM user_data")
+    try:
+        cursor = connection.cursor(dictionary=True)
+        cursor.execute("SELECT * FROM user_data")
+
+        for row in cursor:
+            yield row
+
+        cursor.close()
+    finally:
+        # Also runs when the consumer stops early, so the pool gets its slot back
+        connection.close()
+
+
+def _row_maker(row_format, column_names):
+    """Return a callable turning a row tuple into row_format, or None for tuples."""
+    if row_format == "tuple":
+        return None
+    if row_format == "namedtuple":
+        return namedtuple("User", column_names)._make
+    return lambda row: dict(zip(column_names, row))
+
+
+def _fetch_chunks(cursor, chunk_size, max_buffer_bytes=None):
+    """Yield lists of at most chunk_size rows, sized to fit max_buffer_bytes."""
+    if max_buffer_bytes is None:
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                return
+            yield rows
+
+    largest_row = 0
+    limit = 1  # probe with one row before any full chunk is fetched
+    while True:
+        rows = cursor.fetchmany(limit)
+        if not rows:
+            return
+
+        largest_row = max(largest_row, max(map(_estimate_row_bytes, rows)))
+        if largest_row > max_buffer_bytes:
+            raise MemoryError(
+                f"a single row ({largest_row} bytes) exceeds max_buffer_bytes={max_buffer_bytes}"
+            )
+        yield rows
+        limit = max(1, min(chunk_size, max_buffer_bytes // largest_row))
+
+
+def _estimate_row_bytes(row):
+    """Approximate in-memory size of one row tuple, values included."""
+    return sys.getsizeof(row) + sum(sys.getsizeof(value) for value in row)
+
+
+def _benchmark(label, **kwargs):
+    import resource
+    import time
+
+    start = time.perf_counter()
+    count = 0
+    for _ in stream_users(**kwargs):
+        count += 1
+    elapsed = time.perf_counter() - start
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(f"{label:<28} {count:>10} rows  {count / elapsed:>12.0f} rows/s  peak RSS {peak_kb / 1024:.1f} MiB")
+
 
-    for row in cursor:
-        yield row
+if __name__ == "__main__":
+    # Each mode runs in its own process so that peak RSS is not shared.
+    from multiprocessing import Process
 
-    cursor.close()
-    connection.close()
+    modes = [
+        ("dict rows (original)", {}),
+        ("streamed dicts", {"chunk_size": 1000}),
+        ("streamed tuples", {"chunk_size": 1000, "row_format": "tuple"}),
+        ("streamed namedtuples", {"chunk_size": 1000, "row_format": "namedtuple"}),
+        ("streamed tuples, 1 MiB cap", {"chunk_size": 10000, "row_format": "tuple",
+                                        "max_buffer_bytes": 1 << 20}),
+    ]
+    for label, kwargs in modes:
+        process = Process(target=_benchmark, args=(label,), kwargs=kwargs)
+        process.start()
+        process.join()
@@ -1,37 +1,256 @@
 #!/usr/bin/env python3
-from seed import connect_to_prodev
+import itertools
+import os
+from array import array
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
 
-def stream_users_in_batches(batch_size):
+from seed import USER_COLUMNS, connect_to_prodev
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional, columnar batches fall back to array.array
+    np = None
+
+NUMERIC_COLUMNS = ("age",)
+
+def stream_users_in_batches(batch_size, columnar=False):
     """
     Generator that yields batches of users from the database.
     Each batch is a list of dictionaries with batch_size users.
+
+    With columnar=True each batch is instead a dict mapping column name to
+    the values of that column: a float64 NumPy array (or array('d') without
+    NumPy) for numeric columns such as age, and a NumPy object array of the
+    original str values (or a tuple) for text columns.
     """
     connection = connect_to_prodev()
     if not connection:
         return
 
-    cursor = connection.cursor(dictionary=True)
-    cursor.execute("SELECT * FROM user_data")
+    if columnar:
+        try:
+            cursor = connection.cursor()
+            cursor.execute("SELECT * FROM user_data")
+            columns = cursor.column_names
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield {name: _to_column(name, values) for name, values in zip(columns, zip(*rows))}
+        finally:
+            connection.close()
+        return
+
+    try:
+        cursor = connection.cursor(dictionary=True)
+        cursor.execute("SELECT * FROM user_data")
 
-    batch = []
-    for row in cursor:
-        batch.append(row)
-        if len(batch) == batch_size:
+        batch = []
+        for row in cursor:
+            batch.append(row)
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+
+        if batch:
             yield batch
-            batch = []
 
-    if batch:
-        yield batch
+        cursor.close()
+    finally:
+        connection.close()
+
+
+def _to_column(name, values):
+    if name in NUMERIC_COLUMNS:
+        if np is not None:
+            return np.fromiter(map(float, values), dtype=np.float64, count=len(values))
+        return array("d", map(float, values))
+    if np is not None:
+        # dtype=str would copy every value into fixed-width UCS-4 cells as
+        # wide as the longest one; object arrays keep the str objects
+        return np.array(values, dtype=object)
+    return values
+
+
+def older_than(ages, min_age):
+    """Indices of the entries of a columnar age column greater than min_age."""
+    if np is not None and isinstance(ages, np.ndarray):
+        return np.flatnonzero(ages > min_age)
+    return [i for i, age in enumerate(ages) if age > min_age]
+
 
-    cursor.close()
-    connection.close()
+def _take(column, indices):
+    if np is not None and isinstance(column, np.ndarray):
+        return column[indices].tolist()
+    return [column[i] for i in indices]
 
 
-def batch_processing(batch_size):
+def batch_processing(batch_size, workers=None, ordered=True, columnar=False):
     """
     Processes batches of users by filtering users older than 25 and printing them.
+
+    With workers set, the table is scanned in parallel by parallel_stream_users
+    instead, with the age filter evaluated by the database. With columnar=True
+    the filter is a vectorized mask over columnar batches.
     """
+    if workers:
+        for batch in parallel_stream_users(batch_size, min_age=25, workers=workers, ordered=ordered):
+            for row in batch:
+                print(dict(zip(USER_COLUMNS, row)))
+        return
+
+    if columnar:
+        for batch in stream_users_in_batches(batch_size, columnar=True):
+            indices = older_than(batch["age"], 25)
+            selected = {name: _take(column, indices) for name, column in batch.items()}
+            for row in zip(*selected.values()):
+                print(dict(zip(selected, row)))
+        return
+
     for batch in stream_users_in_batches(batch_size):
         for user in batch:
             if user['age'] > 25:
                 print(user)
+
+
+def parallel_stream_users(batch_size, min_age=None, columns=USER_COLUMNS, workers=None,
+                          ordered=True, partitions=None):
+    """
+    Scans user_data in parallel and yields batches of row tuples.
+
+    The table is split into key ranges on user_id that are scanned by a pool
+    of worker processes, each holding one connection for all of its ranges.
+    By default there are enough ranges for each to hold about four batches,
+    and at most two ranges per worker are in flight, so memory stays bounded
+    however large the table is. The column projection and the age > min_age
+    predicate are part of the SQL, so only matching rows and columns leave
+    the server. With ordered=True batches come back in user_id order,
+    otherwise as soon as each range finishes.
+    """
+    unknown = set(columns) - set(USER_COLUMNS)
+    if unknown:
+        raise ValueError(f"unknown user_data columns: {sorted(unknown)}")
+
+    workers = workers or os.cpu_count() or 1
+    if partitions is None:
+        partitions = max(workers * 4, -(-_count_users() // (batch_size * 4)))
+    tasks = ((low, high, tuple(columns), min_age, batch_size) for low, high in partition_user_ids(partitions))
+
+    with ProcessPoolExecutor(workers, initializer=_open_worker_connection) as pool:
+        pending = deque()
+        try:
+            while True:
+                for task in itertools.islice(tasks, 2 * workers - len(pending)):
+                    pending.append(pool.submit(_scan_partition, task))
+                if not pending:
+                    return
+                if ordered:
+                    done = pending.popleft()
+                else:
+                    done = next(iter(wait(pending, return_when=FIRST_COMPLETED).done))
+                    pending.remove(done)
+                yield from done.result()
+        finally:
+            # Stopped early or failed: don't start the ranges still queued
+            for future in pending:
+                future.cancel()
+
+
+def _count_users():
+    connection = connect_to_prodev()
+    try:
+        cursor = connection.cursor()
+        cursor.execute("SELECT COUNT(*) FROM user_data")
+        return cursor.fetchone()[0]
+    finally:
+        connection.close()
+
+
+def partition_user_ids(partitions):
+    """
+    Splits user_data into at most partitions (low, high) user_id ranges of
+    about equal size. low is inclusive, high exclusive and None means unbounded.
+
+    The boundaries come from a single NTILE pass over the primary key.
+    """
+    connection = connect_to_prodev()
+    try:
+        cursor = connection.cursor()
+        cursor.execute(
+            "SELECT MIN(user_id) FROM "
+            "(SELECT user_id, NTILE(%s) OVER (ORDER BY user_id) AS tile FROM user_data) AS tiles "
+            "GROUP BY tile ORDER BY tile",
+            (partitions,),
+        )
+        bounds = [user_id for (user_id,) in cursor.fetchall()][1:]
+        cursor.close()
+    finally:
+        connection.close()
+
+    return list(zip([None] + bounds, bounds + [None]))
+
+
+# Connection of a worker process, opened once by _open_worker_connection()
+_worker_connection = None
+
+
+def _open_worker_connection():
+    global _worker_connection
+    _worker_connection = connect_to_prodev()
+
+
+def _scan_partition(task):
+    low, high, columns, min_age, batch_size = task
+    conditions, params = [], []
+    if low is not None:
+        conditions.append("user_id >= %s")
+        params.append(low)
+    if high is not None:
+        conditions.append("user_id < %s")
+        params.append(high)
+    if min_age is not None:
+        conditions.append("age > %s")
+        params.append(min_age)
+
+    query = f"SELECT {', '.join(columns)} FROM user_data"
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    query += " ORDER BY user_id"
+
+    cursor = _worker_connection.cursor()
+    try:
+        cursor.execute(query, params)
+        batches = []
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                return batches
+            batches.append(rows)
+    finally:
+        cursor.close()
+
+
+def _benchmark(batch_size):
+    import time
+
+    for label, columnar in (("dict batches", False), ("columnar batches", True)):
+        start = time.perf_counter()
+        rows = older = 0
+        for batch in stream_users_in_batches(batch_size, columnar=columnar):
+            if columnar:
+                rows += len(batch["age"])
+                older += len(older_than(batch["age"], 25))
+            else:
+                rows += len(batch)
+                older += sum(1 for user in batch if user["age"] > 25)
+        elapsed = time.perf_counter() - start
+        print(f"{label:<17} {rows:>9} rows  {older:>9} older than 25  "
+              f"{elapsed:7.2f}s  {rows / elapsed:>10.0f} rows/s")
+
+
+if __name__ == "__main__":
+    import sys
+
+    # Most telling with at least 1M rows in user_data.
+    _benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
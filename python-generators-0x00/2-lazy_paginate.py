@@ -1,18 +1,61 @@
 #!/usr/bin/python3
-from seed import connect_to_prodev
+import contextlib
+import os
+import queue
+import threading
 
+from seed import connect_db, connect_to_prodev
+
+PAGINATION_STRATEGIES = ("offset", "keyset")
 
 
 def paginate_users(page_size, offset):
     connection = connect_to_prodev()
     cursor = connection.cursor(dictionary=True)
-    cursor.execute(f"SELECT * FROM user_data LIMIT {page_size} OFFSET {offset}")
+    cursor.execute("SELECT * FROM user_data LIMIT %s OFFSET %s", (page_size, offset))
     rows = cursor.fetchall()
     connection.close()
     return rows
 
 
-def lazy_pagination(page_size):
+def paginate_users_after(cursor, page_size, last_user_id=""):
+    """Return the page of users that follows last_user_id in primary key order.
+
+    cursor should be a prepared cursor that is reused from page to page: the
+    statement text never changes, so it is prepared once and only the
+    parameters are sent for later pages. The empty string sorts before every
+    user_id, so it fetches the first page.
+    """
+    cursor.execute(
+        "SELECT * FROM user_data WHERE user_id > %s ORDER BY user_id LIMIT %s",
+        (last_user_id, page_size),
+    )
+    columns = cursor.column_names
+    return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+def lazy_pagination(page_size, strategy="offset", prefetch=0):
+    """Yield pages of page_size users until the table is exhausted.
+
+    strategy="offset" pages with LIMIT/OFFSET as before. strategy="keyset"
+    seeks past the last user_id of the previous page on one connection, so
+    every page costs the same however deep into the table it is.
+
+    With prefetch=K a background thread fetches up to K pages ahead while
+    the caller works on the current one; it stops as soon as the caller
+    stops iterating.
+    """
+    if strategy not in PAGINATION_STRATEGIES:
+        raise ValueError(f"strategy must be one of {PAGINATION_STRATEGIES}, got {strategy!r}")
+
+    if prefetch > 0:
+        yield from _prefetched(lambda: lazy_pagination(page_size, strategy), prefetch)
+        return
+
+    if strategy == "keyset":
+        yield from _keyset_pagination(page_size)
+        return
+
     offset = 0
     while True:
         page = paginate_users(page_size, offset)
@@ -20,3 +63,136 @@ def lazy_pagination(page_size):
             break
         yield page
         offset += page_size
+
+
+_DONE = object()
+
+
+def _prefetched(make_pages, prefetch):
+    """Run the generator returned by make_pages in a thread, at most prefetch items ahead."""
+    buffer = queue.Queue(maxsize=prefetch)
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                buffer.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        pages = make_pages()
+        try:
+            for page in pages:
+                if not put(page):
+                    return
+            put(_DONE)
+        except BaseException as exc:
+            put(exc)
+        finally:
+            pages.close()
+
+    producer = threading.Thread(target=produce, name="lazy-pagination-prefetch", daemon=True)
+    producer.start()
+    try:
+        while True:
+            item = buffer.get()
+            if item is _DONE:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        producer.join()
+
+
+def _keyset_pagination(page_size):
+    connection = connect_to_prodev()
+    try:
+        cursor = connection.cursor(prepared=True)
+        last_user_id = ""
+        while True:
+            page = paginate_users_after(cursor, page_size, last_user_id)
+            if not page:
+                break
+            yield page
+            last_user_id = page[-1]["user_id"]
+    finally:
+        connection.close()
+
+
+BENCHMARK_DATABASE = "ALX_prodev_bench"
+
+
+@contextlib.contextmanager
+def _benchmark_database(rows):
+    """Run the block against a scratch copy of user_data holding rows synthetic users.
+
+    The copy lives in BENCHMARK_DATABASE, which connect_to_prodev() is
+    pointed at for the duration of the block and which is dropped when it
+    ends, so ALX_prodev and its change log are never touched.
+    """
+    import uuid
+
+    connection = connect_db()
+    cursor = connection.cursor()
+    previous = os.environ.get("MYSQL_DATABASE")
+    try:
+        cursor.execute(f"DROP DATABASE IF EXISTS {BENCHMARK_DATABASE}")
+        cursor.execute(f"CREATE DATABASE {BENCHMARK_DATABASE}")
+        # LIKE copies the columns and indexes but not the change-log triggers
+        cursor.execute(f"CREATE TABLE {BENCHMARK_DATABASE}.user_data LIKE ALX_prodev.user_data")
+        missing = rows
+        while missing > 0:
+            batch = min(missing, 10000)
+            cursor.executemany(
+                f"INSERT INTO {BENCHMARK_DATABASE}.user_data (user_id, name, email, age) VALUES (%s, %s, %s, %s)",
+                [(str(uuid.uuid4()), "Bench User", "bench@example.com", 18 + i % 60) for i in range(batch)],
+            )
+            connection.commit()
+            missing -= batch
+        os.environ["MYSQL_DATABASE"] = BENCHMARK_DATABASE
+        yield
+    finally:
+        if previous is None:
+            os.environ.pop("MYSQL_DATABASE", None)
+        else:
+            os.environ["MYSQL_DATABASE"] = previous
+        cursor.execute(f"DROP DATABASE IF EXISTS {BENCHMARK_DATABASE}")
+        cursor.close()
+        connection.close()
+
+
+def _benchmark(strategy, page_size, prefetch=0):
+    import time
+
+    latencies = []
+    pages = lazy_pagination(page_size, strategy, prefetch)
+    while True:
+        start = time.perf_counter()
+        page = next(pages, None)
+        if page is None:
+            break
+        latencies.append(time.perf_counter() - start)
+
+    def ms(sample):
+        return 1000 * sorted(sample)[len(sample) // 2] if sample else 0.0
+
+    label = f"{strategy}+prefetch {prefetch}" if prefetch else strategy
+    print(f"{label:<18} {len(latencies):>7} pages  total {sum(latencies):8.2f}s  "
+          f"median first 10 pages {ms(latencies[:10]):7.2f}ms  "
+          f"median last 10 pages {ms(latencies[-10:]):7.2f}ms")
+
+
+if __name__ == "__main__":
+    import sys
+
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    page_size = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    with _benchmark_database(rows):
+        for strategy in PAGINATION_STRATEGIES:
+            _benchmark(strategy, page_size)
+        _benchmark("keyset", page_size, prefetch=4)
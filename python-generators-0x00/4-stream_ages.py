@@ -1,28 +1,40 @@
 from seed import connect_to_prodev
+from stats import RunningStats, pushdown_stats
 
 def stream_user_ages():
     conn = connect_to_prodev()
-    cursor = conn.cursor()
-    cursor.execute("SELECT age FROM user_data")
+    if not conn:
+        return
 
-    for row in cursor:
-        yield row[0]  # just give back the age
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT age FROM user_data")
 
-    conn.close()
+        for row in cursor:
+            yield row[0]  # just give back the age
+    finally:
+        conn.close()
 
 
-def compute_average_age():
-    total = 0
-    count = 0
+def compute_average_age(pushdown=False):
+    """
+    Prints and returns the average age of users.
 
-    for age in stream_user_ages():
-        total += age
-        count += 1
+    By default the ages are streamed and averaged incrementally; with
+    pushdown=True the database computes the average and only one row
+    crosses the wire.
+    """
+    if pushdown:
+        stats, _ = pushdown_stats("age")
+    else:
+        stats = RunningStats().update(stream_user_ages())
 
-    if count > 0:
-        print("Average age of users:", total / count)
+    if stats.count > 0:
+        print("Average age of users:", stats.mean)
+        return stats.mean
     else:
         print("No users in database")
 
 
-compute_average_age()
\ No newline at end of file
+if __name__ == "__main__":
+    compute_average_age()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Asyncio counterparts of the user_data generators, built on aiomysql.
+
+Rows are read through server-side (unbuffered) cursors one chunk at a time,
+and the next chunk is only fetched when the consumer asks for it, so a slow
+consumer never makes the whole table pile up in memory. Connections come
+from one aiomysql pool per event loop, so many scans can run concurrently.
+"""
+import asyncio
+import os
+
+import aiomysql
+
+from seed import db_config
+
+_pools = {}  # event loop -> task creating its pool
+
+
+async def get_async_pool():
+    """Returns the aiomysql pool of the running event loop, creating it on first use."""
+    loop = asyncio.get_running_loop()
+    creating = _pools.get(loop)
+    if creating is None:
+        # Stored before the first await, so that concurrent first callers
+        # wait for the same pool instead of each creating one
+        creating = _pools[loop] = loop.create_task(_create_pool())
+    try:
+        # shield: a cancelled caller must not cancel the creation others wait on
+        return await asyncio.shield(creating)
+    except Exception:
+        if _pools.get(loop) is creating:
+            del _pools[loop]  # let the next caller try again
+        raise
+
+
+async def _create_pool():
+    return await aiomysql.create_pool(
+        minsize=1,
+        maxsize=int(os.environ.get("POOL_SIZE", "5")) or 1,
+        db=os.environ.get("MYSQL_DATABASE", "ALX_prodev"),
+        autocommit=True,
+        **db_config(),
+    )
+
+
+async def close_async_pool():
+    """Closes the pool of the running event loop."""
+    creating = _pools.pop(asyncio.get_running_loop(), None)
+    if creating is None:
+        return
+    try:
+        pool = await creating
+    except Exception:
+        return
+    pool.close()
+    await pool.wait_closed()
+
+
+async def astream_users(chunk_size=1000):
+    """Async generator that yields user records one at a time from the user_data table."""
+    async for batch in astream_users_in_batches(chunk_size):
+        for row in batch:
+            yield row
+
+
+async def astream_users_in_batches(batch_size):
+    """Async generator that yields lists of at most batch_size user dicts."""
+    pool = await get_async_pool()
+    connection = await pool.acquire()
+    finished = False
+    try:
+        cursor = await connection.cursor(aiomysql.SSDictCursor)
+        await cursor.execute("SELECT * FROM user_data")
+        while True:
+            rows = await cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield rows
+        await cursor.close()
+        finished = True
+    finally:
+        if not finished:
+            # The consumer stopped early: drop the connection rather than
+            # letting the cursor drain the rest of the table from the server.
+            connection.close()
+        pool.release(connection)
+
+
+async def alazy_pagination(page_size):
+    """Async generator that yields pages of users, seeking on user_id."""
+    pool = await get_async_pool()
+    async with pool.acquire() as connection:
+        async with connection.cursor(aiomysql.DictCursor) as cursor:
+            last_user_id = ""
+            while True:
+                await cursor.execute(
+                    "SELECT * FROM user_data WHERE user_id > %s ORDER BY user_id LIMIT %s",
+                    (last_user_id, page_size),
+                )
+                page = await cursor.fetchall()
+                if not page:
+                    break
+                yield page
+                last_user_id = page[-1]["user_id"]
+
+
+async def _count_older_than(min_age):
+    count = 0
+    async for user in astream_users():
+        if user["age"] > min_age:
+            count += 1
+    return count
+
+
+async def main():
+    # Several full scans share one event loop and one pool.
+    counts = await asyncio.gather(*(_count_older_than(age) for age in (25, 40, 60)))
+    print("Users older than 25, 40 and 60:", counts)
+
+    pages = 0
+    async for _ in alazy_pagination(100):
+        pages += 1
+    print("Pages of 100 users:", pages)
+    await close_async_pool()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
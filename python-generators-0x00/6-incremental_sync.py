@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+from datetime import timedelta
+
+from seed import connect_to_prodev, read_checkpoint, write_checkpoint
+
+CHECKPOINT_FILE = "user_data.sync_checkpoint"
+
+
+def sync_user_changes(batch_size=1000, checkpoint_file=CHECKPOINT_FILE, gap_timeout=300):
+    """
+    Generator that yields the users changed since the last checkpoint.
+
+    Changes come from the user_data_changes log filled by the triggers that
+    seed.create_table installs. Each change is yielded as (operation, user_id,
+    row): ("upsert", user_id, current row dict) for inserted or updated users
+    and ("delete", user_id, None) for deleted ones. Several changes to the
+    same user within a batch are collapsed into the latest one.
+
+    The checkpoint is the change_id up to which every change has been
+    synced. It is saved to checkpoint_file once the consumer asks for the
+    first change of the next batch (or the generator is exhausted), so an
+    interrupted sync replays at most one batch. Changes logged after the
+    sync started are left for the next run.
+
+    change_ids are assigned when a change is logged but only become
+    visible when its transaction commits, so a missing id may still show
+    up. The checkpoint never moves past such a gap until the change logged
+    right after it is gap_timeout seconds old; by then the id is taken to
+    belong to a rolled-back transaction. Changes after a gap are yielded
+    again by the next sync, which is harmless as every change is resolved
+    to the user's current row.
+    """
+    synced = read_checkpoint(checkpoint_file)
+    connection = connect_to_prodev()
+    if not connection:
+        return
+
+    try:
+        cursor = connection.cursor()
+        cursor.execute("SELECT COALESCE(MAX(change_id), 0), NOW(6) FROM user_data_changes")
+        snapshot, now = cursor.fetchone()
+        settled_before = now - timedelta(seconds=gap_timeout)
+
+        position = synced
+        blocked = False  # an earlier change may still commit
+        while position < snapshot:
+            cursor.execute(
+                """
+                SELECT c.change_id, c.changed_at, c.user_id, c.operation, u.user_id, u.name, u.email, u.age
+                FROM user_data_changes c
+                LEFT JOIN user_data u ON u.user_id = c.user_id
+                WHERE c.change_id > %s AND c.change_id <= %s
+                ORDER BY c.change_id
+                LIMIT %s
+                """,
+                (position, snapshot, batch_size),
+            )
+            rows = cursor.fetchall()
+            if not rows:
+                break
+
+            latest = {}
+            for change_id, changed_at, user_id, operation, current_id, name, email, age in rows:
+                if not blocked:
+                    if change_id != synced + 1 and changed_at > settled_before:
+                        blocked = True
+                    else:
+                        synced = change_id
+                latest.pop(user_id, None)  # keep the latest change last
+                if operation == "D" or current_id is None:
+                    latest[user_id] = ("delete", user_id, None)
+                else:
+                    row = {"user_id": current_id, "name": name, "email": email, "age": age}
+                    latest[user_id] = ("upsert", user_id, row)
+
+            yield from latest.values()
+            position = rows[-1][0]
+            write_checkpoint(checkpoint_file, synced)
+    finally:
+        connection.close()
+
+
+def reset_checkpoint(checkpoint_file=CHECKPOINT_FILE):
+    """Forgets the checkpoint so that the next sync replays the whole change log."""
+    write_checkpoint(checkpoint_file, 0)
+
+
+if __name__ == "__main__":
+    changes = {"upsert": 0, "delete": 0}
+    for operation, user_id, row in sync_user_changes():
+        changes[operation] += 1
+    print(f"Synced {changes['upsert']} upserts and {changes['delete']} deletes")
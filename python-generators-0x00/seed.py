@@ -1,15 +1,40 @@
 import mysql.connector
 from mysql.connector import errorcode
+import collections
 import csv
+import itertools
+import os
+import threading
+import time
 import uuid
+import weakref
+
+# Columns of user_data, in table order
+USER_COLUMNS = ("user_id", "name", "email", "age")
+
+def db_config(database=None, allow_local_infile=False):
+    """
+    Connection settings, read from MYSQL_HOST/PORT/USER/PASSWORD.
+
+    allow_local_infile=True lets the connection send files with LOAD DATA
+    LOCAL INFILE; it is off by default because the server could then ask
+    for any file the client can read.
+    """
+    config = {
+        "host": os.environ.get("MYSQL_HOST", "localhost"),
+        "port": int(os.environ.get("MYSQL_PORT", "3306")),
+        "user": os.environ.get("MYSQL_USER", "root"),
+        "password": os.environ.get("MYSQL_PASSWORD", "your_password"),
+    }
+    if database:
+        config["database"] = database
+    if allow_local_infile:
+        config["allow_local_infile"] = True
+    return config
 
 def connect_db():
     try:
-        connection = mysql.connector.connect(
-            host="localhost",
-            user="root",
-            password="your_password"  # Replace with your actual MySQL password
-        )
+        connection = mysql.connector.connect(**db_config())
         return connection
     except mysql.connector.Error as err:
         print(f"Error: {err}")
@@ -24,18 +49,226 @@ def create_database(connection):
         print(f"Failed creating database: {err}")
 
 def connect_to_prodev():
+    """
+    Returns a connection to ALX_prodev, or None if it cannot be opened.
+
+    Connections come from the process-wide pool returned by get_pool();
+    calling close() on them hands them back to the pool. Set POOL_SIZE=0
+    to open a dedicated connection instead.
+    """
     try:
-        connection = mysql.connector.connect(
-            host="localhost",
-            user="root",
-            password="your_password",  # Replace with your actual MySQL password
-            database="ALX_prodev"
-        )
-        return connection
-    except mysql.connector.Error as err:
+        pool = get_pool()
+        if pool is None:
+            return mysql.connector.connect(**db_config(os.environ.get("MYSQL_DATABASE", "ALX_prodev")))
+        return pool.connect()
+    except (mysql.connector.Error, PoolTimeout) as err:
         print(f"Error: {err}")
         return None
 
+
+class PoolTimeout(Exception):
+    """Raised when no pooled connection becomes available in time."""
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool of mysql.connector connections.
+
+    Up to size connections are kept open; max_overflow more are opened under
+    load and closed as soon as they are returned. Idle connections older
+    than idle_timeout seconds are closed, and every checkout pings the
+    connection first, replacing it if the server has gone away. connect()
+    waits up to timeout seconds for a free connection.
+    """
+
+    def __init__(self, size=5, max_overflow=10, idle_timeout=300.0, timeout=30.0, **connect_args):
+        self.size = size
+        self.max_overflow = max_overflow
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self.connect_args = connect_args
+        self._idle = collections.deque()  # (connection, returned_at), newest on the right
+        self._opened = 0
+        self._in_use = 0
+        self._lock = threading.Condition()
+        self._metrics = {"checkouts": 0, "created": 0, "discarded": 0, "timeouts": 0,
+                         "wait_time": 0.0, "max_wait_time": 0.0}
+
+    def connect(self):
+        """Checks out a connection; close() on it returns it to the pool."""
+        start = time.monotonic()
+        connection = None
+        with self._lock:
+            while True:
+                self._close_expired()
+                if self._idle:
+                    connection, _ = self._idle.pop()
+                    break
+                if self._opened < self.size + self.max_overflow:
+                    self._opened += 1
+                    break
+                remaining = self.timeout - (time.monotonic() - start)
+                if remaining <= 0:
+                    self._metrics["timeouts"] += 1
+                    raise PoolTimeout(f"no connection available after {self.timeout}s")
+                self._lock.wait(remaining)
+            self._in_use += 1
+
+        try:
+            if connection is not None and not self._is_healthy(connection):
+                self._discard(connection, opened=False)
+                connection = None
+            if connection is None:
+                connection = mysql.connector.connect(**self.connect_args)
+                with self._lock:
+                    self._metrics["created"] += 1
+        except BaseException:
+            with self._lock:
+                self._opened -= 1
+                self._in_use -= 1
+                self._lock.notify()
+            raise
+
+        waited = time.monotonic() - start
+        with self._lock:
+            self._metrics["checkouts"] += 1
+            self._metrics["wait_time"] += waited
+            self._metrics["max_wait_time"] = max(self._metrics["max_wait_time"], waited)
+        return PooledConnection(self, connection)
+
+    def stats(self):
+        """Returns checkout/wait counters and current pool occupancy."""
+        with self._lock:
+            stats = dict(self._metrics)
+            stats.update(opened=self._opened, in_use=self._in_use, idle=len(self._idle))
+        stats["avg_wait_time"] = stats["wait_time"] / stats["checkouts"] if stats["checkouts"] else 0.0
+        return stats
+
+    def close_all(self):
+        """Closes every idle connection; checked out ones close when returned."""
+        with self._lock:
+            idle, self._idle = self._idle, collections.deque()
+            self._opened -= len(idle)
+        for connection, _ in idle:
+            self._close_quietly(connection)
+
+    def _release(self, connection):
+        reusable = not getattr(connection, "unread_result", False)
+        if reusable:
+            try:
+                if connection.in_transaction:
+                    connection.rollback()
+            except mysql.connector.Error:
+                reusable = False
+
+        with self._lock:
+            self._in_use -= 1
+            if reusable and self._opened <= self.size:
+                self._idle.append((connection, time.monotonic()))
+                self._lock.notify()
+                return
+        # Overflow connections, and connections left with unread rows by a
+        # consumer that stopped early, are not reused.
+        self._discard(connection)
+
+    def _discard(self, connection, opened=True):
+        self._close_quietly(connection)
+        with self._lock:
+            self._metrics["discarded"] += 1
+            if opened:
+                self._opened -= 1
+                self._lock.notify()
+
+    def _close_expired(self):
+        # Called with the lock held; the oldest idle connections are on the left.
+        now = time.monotonic()
+        while self._idle and now - self._idle[0][1] > self.idle_timeout:
+            connection, _ = self._idle.popleft()
+            self._opened -= 1
+            self._metrics["discarded"] += 1
+            self._close_quietly(connection)
+
+    @staticmethod
+    def _is_healthy(connection):
+        try:
+            connection.ping(reconnect=False)
+            return True
+        except mysql.connector.Error:
+            return False
+
+    @staticmethod
+    def _close_quietly(connection):
+        try:
+            connection.close()
+        except mysql.connector.Error:
+            pass
+
+
+class PooledConnection:
+    """
+    Wraps a pooled connection so that close() returns it to its pool.
+
+    A wrapper that is garbage collected without being closed returns its
+    connection as well, so an abandoned one cannot hold a pool slot.
+    """
+
+    def __init__(self, pool, connection):
+        self._pool = pool
+        self._connection = connection
+        self._release = weakref.finalize(self, pool._release, connection)
+
+    def __getattr__(self, name):
+        if self._connection is None:
+            raise mysql.connector.InterfaceError("Connection was returned to the pool")
+        return getattr(self._connection, name)
+
+    def close(self):
+        self._connection = None
+        self._release()  # runs pool._release at most once
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """
+    Returns the ConnectionPool shared by every generator in this package.
+
+    It is configured from the environment: POOL_SIZE (0 disables pooling),
+    POOL_MAX_OVERFLOW, POOL_IDLE_TIMEOUT, POOL_TIMEOUT and MYSQL_DATABASE, in
+    addition to the settings read by db_config(). A forked child process
+    gets a pool of its own instead of sharing its parent's sockets.
+    """
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool_pid != os.getpid():
+            size = int(os.environ.get("POOL_SIZE", "5"))
+            _pool = None
+            if size > 0:
+                _pool = ConnectionPool(
+                    size=size,
+                    max_overflow=int(os.environ.get("POOL_MAX_OVERFLOW", "10")),
+                    idle_timeout=float(os.environ.get("POOL_IDLE_TIMEOUT", "300")),
+                    timeout=float(os.environ.get("POOL_TIMEOUT", "30")),
+                    **db_config(os.environ.get("MYSQL_DATABASE", "ALX_prodev")),
+                )
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def pool_stats():
+    """Metrics of the shared pool, or None when pooling is disabled."""
+    pool = get_pool()
+    return pool.stats() if pool else None
+
 def create_table(connection):
     try:
         cursor = connection.cursor()
@@ -51,27 +284,189 @@ def create_table(connection):
         cursor.execute(create_table_query)
         print("Table user_data created successfully")
         cursor.close()
+        create_change_log(connection)
     except mysql.connector.Error as err:
         print(f"Error: {err}")
 
-def insert_data(connection, csv_file):
+def create_change_log(connection):
+    """
+    Creates the user_data_changes table and the triggers that record every
+    insert ('I'), update ('U') and delete ('D') on user_data into it.
+
+    Updates that leave the row unchanged, such as the no-op
+    ON DUPLICATE KEY UPDATE of insert_data, are not recorded.
+    """
+    cursor = connection.cursor()
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS user_data_changes (
+        change_id BIGINT AUTO_INCREMENT PRIMARY KEY,
+        user_id CHAR(36) NOT NULL,
+        operation CHAR(1) NOT NULL,
+        changed_at TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6)
+    )
+    """)
+
+    triggers = {
+        "user_data_after_insert": """
+        CREATE TRIGGER user_data_after_insert AFTER INSERT ON user_data FOR EACH ROW
+        INSERT INTO user_data_changes (user_id, operation) VALUES (NEW.user_id, 'I')
+        """,
+        "user_data_after_update": """
+        CREATE TRIGGER user_data_after_update AFTER UPDATE ON user_data FOR EACH ROW
+        BEGIN
+            IF NOT (OLD.user_id <=> NEW.user_id) THEN
+                INSERT INTO user_data_changes (user_id, operation) VALUES (OLD.user_id, 'D');
+            END IF;
+            IF NOT (OLD.user_id <=> NEW.user_id AND OLD.name <=> NEW.name
+                    AND OLD.email <=> NEW.email AND OLD.age <=> NEW.age) THEN
+                INSERT INTO user_data_changes (user_id, operation) VALUES (NEW.user_id, 'U');
+            END IF;
+        END
+        """,
+        "user_data_after_delete": """
+        CREATE TRIGGER user_data_after_delete AFTER DELETE ON user_data FOR EACH ROW
+        INSERT INTO user_data_changes (user_id, operation) VALUES (OLD.user_id, 'D')
+        """,
+    }
+    for create_trigger_query in triggers.values():
+        try:
+            cursor.execute(create_trigger_query)
+        except mysql.connector.Error as err:
+            if err.errno != errorcode.ER_TRG_ALREADY_EXISTS:
+                raise
+    print("Change log user_data_changes created successfully")
+    cursor.close()
+
+def insert_data(connection, csv_file, batch_size=1000, checkpoint_file=None, use_load_data=False):
+    """
+    Bulk loads csv_file into user_data, skipping users that already exist.
+
+    Rows are streamed from the CSV in batches of batch_size, written with one
+    multi-row INSERT ... ON DUPLICATE KEY per batch and committed per batch.
+    After each commit the number of CSV rows loaded so far is saved to
+    checkpoint_file (csv_file + ".checkpoint" by default), so a load that dies
+    midway resumes after the last committed batch. The checkpoint is removed
+    once the whole file is loaded.
+
+    With use_load_data=True the file is sent with LOAD DATA LOCAL INFILE
+    instead, on a connection of its own opened with allow_local_infile, and
+    starting after the rows a checkpoint says are already loaded. If the
+    server refuses it, the reason is printed and the batched inserts run
+    instead. Returns the number of rows processed.
+
+    Rows without a user_id get a uuid5 of the file's path and the row's
+    number, so a batch that is loaded again after a crash between its commit
+    and its checkpoint updates the same users instead of adding new ones.
+    LOAD DATA gives them UUID(), which is safe there as it commits every
+    remaining row at once.
+    """
+    if checkpoint_file is None:
+        checkpoint_file = csv_file + ".checkpoint"
+
+    if use_load_data:
+        try:
+            return _load_data_infile(connection, csv_file, checkpoint_file)
+        except (mysql.connector.Error, ValueError) as err:
+            print(f"LOAD DATA LOCAL INFILE failed ({err}), falling back to batched inserts")
+
     try:
+        done = read_checkpoint(checkpoint_file)
+        if done:
+            print(f"Resuming {csv_file} after {done} committed rows")
+
         cursor = connection.cursor()
+        start = time.perf_counter()
+        loaded = 0
+        path = os.path.abspath(csv_file)
         with open(csv_file, newline='') as csvfile:
-            reader = csv.DictReader(csvfile)
-            for row in reader:
-                user_id = row.get('user_id') or str(uuid.uuid4())
-                name = row['name']
-                email = row['email']
-                age = row['age']
-                
-                cursor.execute("SELECT 1 FROM user_data WHERE user_id = %s", (user_id,))
-                if not cursor.fetchone():
-                    cursor.execute(
-                        "INSERT INTO user_data (user_id, name, email, age) VALUES (%s, %s, %s, %s)",
-                        (user_id, name, email, age)
-                    )
-        connection.commit()
+            reader = enumerate(itertools.islice(csv.DictReader(csvfile), done, None), done)
+            while True:
+                batch = [
+                    (row.get('user_id') or str(uuid.uuid5(uuid.NAMESPACE_URL, f"{path}:{number}")),
+                     row['name'], row['email'], row['age'])
+                    for number, row in itertools.islice(reader, batch_size)
+                ]
+                if not batch:
+                    break
+                cursor.executemany(
+                    "INSERT INTO user_data (user_id, name, email, age) VALUES (%s, %s, %s, %s) "
+                    "ON DUPLICATE KEY UPDATE user_id = user_id",
+                    batch
+                )
+                connection.commit()
+                loaded += len(batch)
+                write_checkpoint(checkpoint_file, done + loaded)
         cursor.close()
+
+        elapsed = time.perf_counter() - start
+        print(f"Loaded {loaded} rows in {elapsed:.2f}s ({loaded / elapsed if elapsed else 0:.0f} rows/sec)")
+        if os.path.exists(checkpoint_file):
+            os.remove(checkpoint_file)
+        return done + loaded
     except Exception as e:
         print(f"Failed to insert data: {e}")
+
+
+def _load_data_infile(connection, csv_file, checkpoint_file):
+    with open(csv_file, newline='') as csvfile:
+        first_line = csvfile.readline()
+    header = next(csv.reader([first_line]))
+    line_end = '\\r\\n' if first_line.endswith('\r\n') else '\\n'
+
+    # The header names end up in the statement, so only user_data columns may
+    # pass; any other column is read into a user variable and dropped
+    known = [name for name in header if name in USER_COLUMNS]
+    if len(set(known)) != len(known):
+        raise ValueError(f"{csv_file} header names a user_data column more than once: {header}")
+
+    done = read_checkpoint(checkpoint_file)
+    if done:
+        print(f"Resuming {csv_file} after {done} committed rows")
+
+    columns = ['@user_id' if name == 'user_id' else name if name in USER_COLUMNS else '@dummy'
+               for name in header]
+    if 'user_id' in header:
+        set_user_id = "SET user_id = COALESCE(NULLIF(@user_id, ''), UUID())"
+    else:
+        set_user_id = "SET user_id = UUID()"
+    path = os.path.abspath(csv_file).replace('\\', '\\\\').replace("'", "\\'")
+
+    # LOCAL INFILE has to be enabled when the connection is opened
+    infile_connection = mysql.connector.connect(**db_config(connection.database, allow_local_infile=True))
+    try:
+        cursor = infile_connection.cursor()
+        start = time.perf_counter()
+        cursor.execute(
+            f"LOAD DATA LOCAL INFILE '{path}' IGNORE INTO TABLE user_data "
+            f"FIELDS TERMINATED BY ',' OPTIONALLY ENCLOSED BY '\"' "
+            f"LINES TERMINATED BY '{line_end}' IGNORE {1 + done} LINES "
+            f"({', '.join(columns)}) {set_user_id}"
+        )
+        loaded = cursor.rowcount
+        infile_connection.commit()
+        cursor.close()
+    finally:
+        infile_connection.close()
+
+    # The statement loads all remaining rows or none, so there is nothing to resume
+    if os.path.exists(checkpoint_file):
+        os.remove(checkpoint_file)
+    elapsed = time.perf_counter() - start
+    print(f"Loaded {loaded} rows in {elapsed:.2f}s ({loaded / elapsed if elapsed else 0:.0f} rows/sec)")
+    return done + loaded
+
+
+def read_checkpoint(checkpoint_file):
+    try:
+        with open(checkpoint_file) as f:
+            return int(f.read().strip() or 0)
+    except FileNotFoundError:
+        return 0
+
+
+def write_checkpoint(checkpoint_file, position):
+    # Write then rename so a crash never leaves a half-written checkpoint.
+    tmp_file = checkpoint_file + ".tmp"
+    with open(tmp_file, "w") as f:
+        f.write(str(position))
+    os.replace(tmp_file, checkpoint_file)
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Aggregations over user_data, computed either by the database or
+incrementally over any of the generators in this package.
+
+RunningStats keeps a mergeable partial state (count, mean, M2, min, max)
+updated with Welford's algorithm, so partitions scanned in parallel can be
+summarised separately and combined afterwards. pushdown_stats asks the
+database for the same state plus optional percentiles in a few queries
+instead of streaming the column to the client.
+"""
+import math
+import re
+
+from seed import connect_to_prodev
+
+_IDENTIFIER = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+
+class RunningStats:
+    """Count, mean, variance, min and max of a stream of numbers."""
+
+    __slots__ = ("count", "mean", "m2", "min", "max")
+
+    def __init__(self, count=0, mean=0.0, m2=0.0, min=None, max=None):
+        self.count = count
+        self.mean = mean
+        self.m2 = m2
+        self.min = min
+        self.max = max
+
+    def add(self, value):
+        value = float(value)
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+        return self
+
+    def update(self, values):
+        for value in values:
+            self.add(value)
+        return self
+
+    def merge(self, other):
+        """Fold another partial state into this one (Chan et al.)."""
+        if not other.count:
+            return self
+        if not self.count:
+            self.count, self.mean, self.m2 = other.count, other.mean, other.m2
+            self.min, self.max = other.min, other.max
+            return self
+
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.count = count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    def __add__(self, other):
+        return RunningStats().merge(self).merge(other)
+
+    @property
+    def variance(self):
+        return self.m2 / self.count if self.count else None
+
+    @property
+    def stddev(self):
+        return math.sqrt(self.m2 / self.count) if self.count else None
+
+    def as_dict(self):
+        return {
+            "count": self.count,
+            "avg": self.mean if self.count else None,
+            "min": self.min,
+            "max": self.max,
+            "stddev": self.stddev,
+        }
+
+    def __repr__(self):
+        return (f"RunningStats(count={self.count}, mean={self.mean!r}, m2={self.m2!r}, "
+                f"min={self.min!r}, max={self.max!r})")
+
+
+def pushdown_stats(column="age", table="user_data", where=None, params=(),
+                   percentiles=(), connection=None):
+    """
+    Computes the RunningStats of table.column in the database.
+
+    where/params restrict the rows (e.g. a key range of one partition), and
+    the returned state can be merged with the states of other partitions.
+    Each requested percentile (0..1, nearest rank) costs one extra query that
+    seeks into the sorted column; they are returned as {p: value} next to the
+    state. Pass an open connection to reuse it, otherwise one is opened.
+    """
+    for name in (column, table):
+        if not _IDENTIFIER.match(name):
+            raise ValueError(f"invalid identifier: {name!r}")
+    clause = f" WHERE ({where})" if where else ""
+    not_null = f"{clause} AND" if where else " WHERE"
+
+    own_connection = connection is None
+    if own_connection:
+        connection = connect_to_prodev()
+    try:
+        cursor = connection.cursor()
+        cursor.execute(
+            f"SELECT COUNT({column}), AVG({column}), VAR_POP({column}), "
+            f"MIN({column}), MAX({column}) FROM {table}{clause}",
+            params,
+        )
+        count, avg, var_pop, low, high = cursor.fetchone()
+        state = RunningStats()
+        if count:
+            state = RunningStats(count, float(avg), float(var_pop) * count, float(low), float(high))
+
+        values = {}
+        for p in percentiles:
+            if not 0 <= p <= 1:
+                raise ValueError(f"percentile must be between 0 and 1, got {p!r}")
+            if not count:
+                values[p] = None
+                continue
+            cursor.execute(
+                f"SELECT {column} FROM {table}{not_null} {column} IS NOT NULL "
+                f"ORDER BY {column} LIMIT 1 OFFSET %s",
+                tuple(params) + (max(math.ceil(p * count) - 1, 0),),
+            )
+            values[p] = float(cursor.fetchone()[0])
+        cursor.close()
+    finally:
+        if own_connection:
+            connection.close()
+
+    return state, values
+
+
+def stream_stats(values):
+    """Computes the RunningStats of any iterable of numbers, e.g. stream_user_ages()."""
+    return RunningStats().update(values)